@@ -0,0 +1,165 @@
+"""
+Pure helpers of MessageRouter for the per-webhook hot path (recipient rules, audio
+attachment lookup), moved out of the class as stateless module-level functions.
+"""
+
+from typing import Any, Callable
+
+from app.domain.message import MediaContent
+
+# Extensões de áudio aceites para enviar como voice/audio no Telegram
+AUDIO_EXTENSIONS = frozenset({"ogg", "oga", "m4a", "mp3", "opus", "wav"})
+AUDIO_FILE_TYPES = frozenset({"audio", "voice"})
+
+
+def dig(src: Any, *path: Any, default: Any = None) -> Any:
+    """Safe dict traversal: dig(d, 'a','b','c') -> d['a']['b']['c'] or default."""
+    cur: Any = src
+    try:
+        for key in path:
+            cur = cur[key]
+    except (KeyError, TypeError, IndexError):
+        return default
+    return cur
+
+
+def conversation_meta(payload: Any) -> dict[str, Any]:
+    """payload['conversation']['meta'] (channel, sender) in one try, or {} when missing."""
+    try:
+        meta = payload["conversation"]["meta"]
+    except (KeyError, TypeError, IndexError):
+        return {}
+    return meta if isinstance(meta, dict) else {}
+
+
+def clean(s: str | None) -> str | None:
+    """Stripped string or None; skips str.strip() in the common already-clean case."""
+    if not s:
+        return None
+    if s[0].isspace() or s[-1].isspace():
+        return s.strip() or None
+    return s
+
+
+def _text_or_none(value: Any) -> str | None:
+    """Stripped string, or None when missing/blank."""
+    if value is None:
+        return None
+    return clean(value if isinstance(value, str) else str(value))
+
+
+def _telegram_id(value: Any) -> str | None:
+    """Numeric Telegram user id -> 'id:<int>' (adapter resolves it as a user id)."""
+    if _text_or_none(value) is None:
+        return None
+    return f"id:{value}"
+
+
+# Caracteres aceites em recipient_id (ASCII); bytes.translate apaga-os e sobra só o inválido
+# ("@" só como prefixo do username, tratado à parte)
+_USERNAME_CHARS = b"_0123456789ABCDEFGHIJKLMNOPQRSTUVWXYZabcdefghijklmnopqrstuvwxyz"
+_PHONE_CHARS = b"+0123456789"
+# Separadores comuns em telefones de contactos importados ("+55 11 9999-0000"), removidos
+_PHONE_SEPARATORS = str.maketrans("", "", " -().")
+
+
+def _only_chars(s: str, allowed: bytes) -> bool:
+    """True if every char of s is in allowed (one C-level table scan, no Python loop)."""
+    return s.isascii() and not s.encode("ascii").translate(None, allowed)
+
+
+def _username_or_none(value: Any) -> str | None:
+    """Telegram username ('@name' or 'name'), or None if blank/has invalid characters."""
+    text = _text_or_none(value)
+    if not text:
+        return None
+    name = text[1:] if text[0] == "@" else text
+    return text if name and _only_chars(name, _USERNAME_CHARS) else None
+
+
+def _phone_or_none(value: Any) -> str | None:
+    """Phone number without separators ('+7999...'), or None if blank/has invalid characters."""
+    text = _text_or_none(value)
+    if not text:
+        return None
+    phone = text.translate(_PHONE_SEPARATORS)
+    return phone if phone and _only_chars(phone, _PHONE_CHARS) else None
+
+
+# Derivação de recipient_id por canal: uma função por canal, regras por prioridade
+def _derive_whatsapp(sender: Any) -> str | None:
+    # Sem validação de caracteres: o número segue como está no Chatwoot (o Wasender normaliza)
+    return _text_or_none(dig(sender, "phone_number"))
+
+
+def _derive_telegram(sender: Any) -> str | None:
+    return (
+        _username_or_none(dig(sender, "custom_attributes", "telegram_username"))
+        or _username_or_none(
+            dig(sender, "additional_attributes", "social_telegram_user_name")
+        )
+        or _phone_or_none(dig(sender, "phone_number"))
+        or _telegram_id(dig(sender, "custom_attributes", "telegram_user_id"))
+        or _telegram_id(dig(sender, "additional_attributes", "social_telegram_user_id"))
+    )
+
+
+def _derive_vk(sender: Any) -> str | None:
+    return _text_or_none(
+        dig(sender, "custom_attributes", "vk_peer_id")
+    ) or _text_or_none(dig(sender, "custom_attributes", "vk_user_id"))
+
+
+_DERIVERS: dict[str, Callable[[Any], str | None]] = {
+    "whatsapp": _derive_whatsapp,
+    "telegram": _derive_telegram,
+    "vk": _derive_vk,
+}
+
+
+def derive_recipient_id(channel: str | None, payload: dict[str, Any]) -> str | None:
+    """recipient_id for channel from conversation.meta.sender (per-channel _derive_*)."""
+    deriver = _DERIVERS.get(channel) if channel else None
+    if deriver is None:
+        # Other channels: do not guess
+        return None
+    return deriver(conversation_meta(payload).get("sender") or {})
+
+
+def resolve_attachment_url(chatwoot_base: str, data_url: str) -> str:
+    """
+    Converte URL relativa do Chatwoot em absoluta (necessário para download).
+    data_url já vem limpo (clean) de first_audio_attachment.
+    """
+    if chatwoot_base and data_url.startswith("/"):
+        return chatwoot_base + data_url
+    return data_url
+
+
+def first_audio_attachment(
+    attachments: list[dict[str, Any]], chatwoot_base: str, transcript: str = ""
+) -> MediaContent | None:
+    """Extrai o primeiro anexo de áudio (data_url) para enviar ao Telegram."""
+    for att in attachments:
+        if not isinstance(att, dict):
+            continue
+        data_url = clean(att.get("data_url") or att.get("file_url"))
+        if not data_url:
+            continue
+        # file_type primeiro (caso comum: voice/audio); extensão só se falhar
+        file_type = att.get("file_type")
+        is_audio = bool(file_type) and file_type.lower() in AUDIO_FILE_TYPES
+        if not is_audio:
+            ext = att.get("extension")
+            is_audio = bool(ext) and ext.lstrip(".").lower() in AUDIO_EXTENSIONS
+        if is_audio:
+            return MediaContent(
+                type="media",
+                media_type="audio",
+                url=resolve_attachment_url(chatwoot_base, data_url),
+                caption=None,
+                filename=att.get("filename"),
+                mime_type=att.get("content_type"),
+                transcript=(transcript or None),
+            )
+    return None
@@ -1,16 +1,113 @@
+import asyncio
 import logging
-from typing import Any, Dict, Literal, Optional
+import time
+from collections import OrderedDict
+from typing import Any, Awaitable, Callable, Dict, List, Literal, Optional, Tuple, TypeVar
+
+import httpx
 
 from app.infra.chatwoot_client import ChatwootClient
+from app.infra.inflight import Inflight
+from app.infra.retry import retry_on_429
 
 logger = logging.getLogger(__name__)
 
+# Cache de contactos por identificador de plataforma -> (contact_id, source_id)
+CONTACT_CACHE_MAX = 10_000
+CONTACT_CACHE_TTL_SEC = 3600.0
+# Cache da conversa ativa por (contact_id, source_id); TTL curto para limitar staleness
+CONVERSATION_CACHE_MAX = 10_000
+CONVERSATION_CACHE_TTL_SEC = 60.0
+# Máximo de pedidos simultâneos à API do Chatwoot (bursts de webhooks esperam em fila)
+CHATWOOT_MAX_CONCURRENCY = 32
+
+ContactCacheKey = Tuple[int, str, str]
+ContactAttrs = Tuple[Dict[str, Any], Optional[Dict[str, Any]]]
+# (contact_id, source_id, expires_at, last attributes written)
+CachedContact = Tuple[int, str, float, ContactAttrs]
+T = TypeVar("T")
+
+
+def _as_int(value: Any) -> int:
+    """Chatwoot ids already come as int in JSON; only convert when they do not."""
+    return value if type(value) is int else int(value)
+
 
 class ChatwootService:
     """Uses ChatwootClient to upsert contact, ensure conversation, and post messages."""
 
-    def __init__(self, client: ChatwootClient):
+    def __init__(
+        self, client: ChatwootClient, max_concurrency: int = CHATWOOT_MAX_CONCURRENCY
+    ):
         self._client = client
+        self._sem = asyncio.Semaphore(max_concurrency)
+        self._contact_cache: "OrderedDict[ContactCacheKey, CachedContact]" = OrderedDict()
+        # (contact_id, source_id) -> (conversation_id, expires_at)
+        self._conv_cache: "OrderedDict[Tuple[int, str], Tuple[int, float]]" = OrderedDict()
+        # Pedidos em curso (lookup/upsert de contacto, conversa) partilhados por chave
+        self._inflight: Inflight[Any] = Inflight()
+
+    async def _limited(self, fn: Callable[..., Awaitable[T]], *args: Any, **kwargs: Any) -> T:
+        async with self._sem:
+            return await fn(*args, **kwargs)
+
+    _call_once = retry_on_429()(_limited)
+    _call_idempotent = retry_on_429(idempotent=True)(_limited)
+
+    async def _call(
+        self,
+        fn: Callable[..., Awaitable[T]],
+        *args: Any,
+        idempotent: bool = False,
+        **kwargs: Any,
+    ) -> T:
+        """
+        Run a ChatwootClient call under the concurrency limit (backoff sleeps outside it).
+        idempotent=True for reads/PATCH: 502/504 are retried too (never for creating POSTs).
+        """
+        call = self._call_idempotent if idempotent else self._call_once
+        return await call(fn, *args, **kwargs)
+
+    async def _coalesce(self, key: Tuple[Any, ...], factory: Callable[[], Awaitable[T]]) -> T:
+        """
+        Run factory() once per key: concurrent callers with the same key await the
+        in-flight result instead of repeating the Chatwoot calls. key[1] None -> no coalescing.
+        """
+        if key[1] is None:
+            return await factory()
+        return await self._inflight.run(key, factory)
+
+    @staticmethod
+    def _contact_cache_key(
+        inbox_id: int, search_key: str, custom_attributes: Dict[str, Any]
+    ) -> Optional[ContactCacheKey]:
+        """Platform identifier used to cache the contact (vk/telegram user id, else search_key)."""
+        for attr in ("vk_user_id", "telegram_user_id"):
+            value = custom_attributes.get(attr)
+            if value:
+                return (int(inbox_id), attr, str(value))
+        if search_key:
+            return (int(inbox_id), "search_key", search_key)
+        return None
+
+    def _remember_contact(
+        self,
+        key: Optional[ContactCacheKey],
+        contact_id: int,
+        source_id: str,
+        attrs: ContactAttrs,
+    ) -> None:
+        if key is None:
+            return
+        self._contact_cache[key] = (
+            contact_id,
+            source_id,
+            time.monotonic() + CONTACT_CACHE_TTL_SEC,
+            attrs,
+        )
+        self._contact_cache.move_to_end(key)
+        while len(self._contact_cache) > CONTACT_CACHE_MAX:
+            self._contact_cache.popitem(last=False)
 
     async def ensure_contact(
         self,
@@ -30,110 +127,312 @@ class ChatwootService:
         - Else try /contacts/search with search_key (e.g., phone for WhatsApp).
         - If found -> update attributes (best effort).
         - If not found -> create with inbox_id + attributes.
+        Results are cached by platform identifier; a cache hit skips the lookups and only
+        PATCHes the contact when the attributes differ from the last ones written.
         """
-        contacts = []
+        contact = await self.lookup_contact(
+            inbox_id=inbox_id,
+            search_key=search_key,
+            custom_attributes=custom_attributes,
+        )
+        return await self.upsert_contact(
+            contact,
+            inbox_id=inbox_id,
+            search_key=search_key,
+            name=name,
+            phone=phone,
+            email=email,
+            custom_attributes=custom_attributes,
+            additional_attributes=additional_attributes,
+        )
 
-        vk_user_id = (custom_attributes or {}).get("vk_user_id")
-        telegram_user_id = (custom_attributes or {}).get("telegram_user_id")
-        vk_identifier = f"vk:{vk_user_id}" if vk_user_id else None
-        # Identifier para Telegram: permite que search encontre o contacto depois (filter dá 422 em muitas instâncias)
-        tg_identifier = (
-            f"telegram:{telegram_user_id}" if telegram_user_id else None
+    async def lookup_contact(
+        self,
+        *,
+        inbox_id: int,
+        search_key: str,
+        custom_attributes: Dict[str, Any],
+    ) -> Optional[Dict[str, Any]]:
+        """
+        Find an existing contact without writing anything: cache, then /contacts/filter,
+        then /contacts/search. Only the lookup keys (platform user id, search_key) are needed,
+        so callers can run it while they are still gathering the attributes for upsert_contact.
+        Returns the Chatwoot contact, a cache entry ({'id', 'source_id', 'cached': True}) or None.
+        Concurrent lookups for the same contact share one request.
+        """
+        cache_key = self._contact_cache_key(inbox_id, search_key, custom_attributes or {})
+        return await self._coalesce(
+            ("lookup", cache_key),
+            lambda: self._lookup_contact(
+                inbox_id=inbox_id,
+                search_key=search_key,
+                custom_attributes=custom_attributes,
+            ),
         )
-        identifier = vk_identifier or tg_identifier
+
+    async def _lookup_contact(
+        self,
+        *,
+        inbox_id: int,
+        search_key: str,
+        custom_attributes: Dict[str, Any],
+    ) -> Optional[Dict[str, Any]]:
+        custom_attributes = custom_attributes or {}
+        cache_key = self._contact_cache_key(inbox_id, search_key, custom_attributes)
+        cached = self._contact_cache.get(cache_key) if cache_key else None
+        if cached is not None:
+            contact_id, source_id, expires_at, _ = cached
+            if time.monotonic() < expires_at:
+                self._contact_cache.move_to_end(cache_key)
+                return {"id": contact_id, "source_id": source_id, "cached": True}
+            self._contact_cache.pop(cache_key, None)
+
+        telegram_user_id = custom_attributes.get("telegram_user_id")
+        tg_identifier = f"telegram:{telegram_user_id}" if telegram_user_id else None
 
         # 1) Attribute-based lookup (filter pode dar 422 se custom_attributes não forem suportados)
-        attr_lookup_keys = [
-            k
+        lookup_attrs = {
+            k: custom_attributes[k]
             for k in ("vk_user_id", "telegram_user_id")
-            if k in (custom_attributes or {})
-        ]
-        if attr_lookup_keys:
+            if k in custom_attributes
+        }
+        # 2) Fallback search: para Telegram, procurar por identifier que definimos ao criar
+        search_queries = []
+        if tg_identifier:
+            search_queries.append(tg_identifier)
+        if search_key and search_key not in search_queries:
+            search_queries.append(search_key)
+
+        # O filter responde à maioria dos contactos conhecidos: só procurar se não encontrar
+        if lookup_attrs:
+            contacts = await self._filter_contacts(lookup_attrs)
+            if contacts:
+                return contacts[0]
+        if not search_queries:
+            return None
+        # Searches em paralelo (um só round-trip num contacto novo), lidos por prioridade;
+        # o primeiro com resultado cancela os restantes ainda em curso
+        tasks = [asyncio.ensure_future(self._search_contacts(q)) for q in search_queries]
+        try:
+            for task in tasks:
+                contacts = await task
+                if contacts:
+                    return contacts[0]
+            return None
+        finally:
+            for task in tasks:
+                task.cancel()
+
+    async def _filter_contacts(self, attrs: Dict[str, Any]) -> List[Dict[str, Any]]:
+        try:
+            res = await self._call(self._client.filter_contacts, attrs, idempotent=True)
+        except (httpx.HTTPError, ValueError) as e:
+            logger.warning("[chatwoot] filter_contacts failed: %s", e)
+            return []
+        return (res or {}).get("payload") or []
+
+    async def _search_contacts(self, q: str) -> List[Dict[str, Any]]:
+        try:
+            res = await self._call(self._client.search_contacts, q=q, idempotent=True)
+        except (httpx.HTTPError, ValueError) as e:
+            logger.warning("[chatwoot] search_contacts q=%r failed: %s", q, e)
+            return []
+        contacts = (res or {}).get("payload") or []
+        if isinstance(contacts, dict):
+            contacts = contacts.get("contacts", contacts.get("payload", [])) or []
+        return contacts
+
+    async def upsert_contact(
+        self,
+        contact: Optional[Dict[str, Any]],
+        *,
+        inbox_id: int,
+        search_key: str,
+        name: Optional[str],
+        phone: Optional[str],
+        email: Optional[str],
+        custom_attributes: Dict[str, Any],
+        additional_attributes: Optional[Dict[str, Any]] = None,
+    ) -> Dict[str, Any]:
+        """
+        Update the contact found by lookup_contact (or create it when None) and
+        return {'id', 'source_id'}. Concurrent upserts for the same contact are coalesced,
+        so two simultaneous first messages do not create the contact twice.
+        """
+        cache_key = self._contact_cache_key(inbox_id, search_key, custom_attributes or {})
+        return await self._coalesce(
+            ("upsert", cache_key),
+            lambda: self._upsert_contact(
+                contact,
+                inbox_id=inbox_id,
+                search_key=search_key,
+                name=name,
+                phone=phone,
+                email=email,
+                custom_attributes=custom_attributes,
+                additional_attributes=additional_attributes,
+            ),
+        )
+
+    async def _upsert_contact(
+        self,
+        contact: Optional[Dict[str, Any]],
+        *,
+        inbox_id: int,
+        search_key: str,
+        name: Optional[str],
+        phone: Optional[str],
+        email: Optional[str],
+        custom_attributes: Dict[str, Any],
+        additional_attributes: Optional[Dict[str, Any]] = None,
+    ) -> Dict[str, Any]:
+        custom_attributes = custom_attributes or {}
+        cache_key = self._contact_cache_key(inbox_id, search_key, custom_attributes)
+        attrs: ContactAttrs = (dict(custom_attributes), additional_attributes)
+        identifier = self._platform_identifier(custom_attributes)
+
+        if contact is None and cache_key:
+            # Outro evento pode ter criado o contacto depois do nosso lookup
+            cached_entry = self._contact_cache.get(cache_key)
+            if cached_entry is not None:
+                contact = {"id": cached_entry[0], "source_id": cached_entry[1], "cached": True}
+
+        if contact is not None and contact.get("cached"):
+            contact_id, source_id = contact["id"], contact["source_id"]
+            cached = self._contact_cache.get(cache_key) if cache_key else None
+            if cached is not None and cached[3] == attrs:
+                return {"id": contact_id, "source_id": source_id}
             try:
-                res = await self._client.filter_contacts(
-                    {k: custom_attributes[k] for k in attr_lookup_keys}
+                await self._call(
+                    self._client.update_contact,
+                    idempotent=True,
+                    contact_id=contact_id,
+                    custom_attributes=custom_attributes,
+                    additional_attributes=additional_attributes,
+                )
+                self._remember_contact(cache_key, contact_id, source_id, attrs)
+                return {"id": contact_id, "source_id": source_id}
+            except (httpx.HTTPError, ValueError) as e:
+                # Contacto pode ter sido apagado/fundido no Chatwoot: refazer o lookup
+                logger.warning("[chatwoot] cached contact update failed: %s", e)
+                if cache_key:
+                    self._contact_cache.pop(cache_key, None)
+                contact = await self.lookup_contact(
+                    inbox_id=inbox_id,
+                    search_key=search_key,
+                    custom_attributes=custom_attributes,
                 )
-                contacts = (res or {}).get("payload") or []
-            except Exception as e:
-                logger.warning("[chatwoot] filter_contacts failed: %s", e)
 
-        # 2) Fallback search: para Telegram, procurar por identifier que definimos ao criar
-        if not contacts:
-            search_queries = []
-            if tg_identifier:
-                search_queries.append(tg_identifier)
-            if search_key and search_key not in search_queries:
-                search_queries.append(search_key)
-            for q in search_queries:
-                try:
-                    res = await self._client.search_contacts(q=q)
-                    contacts = (res or {}).get("payload") or []
-                    if isinstance(contacts, dict):
-                        contacts = contacts.get("contacts", contacts.get("payload", [])) or []
-                    if contacts:
-                        break
-                except Exception as e:
-                    logger.warning("[chatwoot] search_contacts q=%r failed: %s", q, e)
-
-        # 3) Update or create
-        if contacts:
-            contact = contacts[0]
-            contact_id = int(contact.get("id"))
-            # Update attributes only if provided
-            if custom_attributes or additional_attributes is not None:
+        if contact is not None:
+            contact_id = _as_int(contact.get("id"))
+            # Um único PATCH: atributos (se fornecidos) + nome (só se o contacto não tiver nome)
+            fill_name = name if name and not (contact.get("name") or "").strip() else None
+            # Sem alterações face ao contacto devolvido pelo lookup -> não fazer PATCH
+            unchanged = (
+                not fill_name
+                and (not identifier or contact.get("identifier") == identifier)
+                and self._attrs_contained(contact.get("custom_attributes"), custom_attributes)
+                and self._attrs_contained(
+                    contact.get("additional_attributes"), additional_attributes
+                )
+            )
+            if unchanged:
+                logger.debug("[chatwoot] contact id=%s unchanged, update skipped", contact_id)
+            elif custom_attributes or additional_attributes is not None or fill_name:
                 try:
-                    await self._client.update_contact(
+                    await self._call(
+                        self._client.update_contact,
+                        idempotent=True,
                         contact_id=contact_id,
-                        name=None,
+                        name=fill_name,
                         phone_number=None,
                         email=None,
                         identifier=identifier,
-                        custom_attributes=custom_attributes,
+                        custom_attributes=custom_attributes or None,
                         additional_attributes=additional_attributes,  # NEW
                     )
-                except Exception as e:
+                except (httpx.HTTPError, ValueError) as e:
                     logger.warning("[chatwoot] update_contact skipped: %s", e)
-            # Optionally set name if empty
-            if name and not (contact.get("name") or "").strip():
-                try:
-                    await self._client.update_contact(
-                        contact_id=contact_id,
-                        name=name,
-                    )
-                except Exception as e:
-                    logger.warning("[chatwoot] update name skipped: %s", e)
+                    cache_key = None  # não cachear: atributos podem não estar gravados
+                    if fill_name:
+                        # O PATCH combinado falhou: tentar ao menos preencher o nome sozinho
+                        try:
+                            await self._call(
+                                self._client.update_contact,
+                                idempotent=True,
+                                contact_id=contact_id,
+                                name=fill_name,
+                            )
+                        except (httpx.HTTPError, ValueError) as e2:
+                            logger.warning("[chatwoot] update_contact name skipped: %s", e2)
         else:
-            created = await self._client.create_contact(
+            created = await self._call(
+                self._client.create_contact,
                 inbox_id=inbox_id,
                 name=name or search_key,
                 phone_number=phone,
                 email=email,
                 identifier=identifier,
-                custom_attributes=custom_attributes or {},
+                custom_attributes=custom_attributes,
                 additional_attributes=additional_attributes,  # NEW
             )
-            payload = (created or {}).get("payload") or {}
-            contact = payload.get("contact") or created.get("contact") or {}
-            if not contact and "id" in (created or {}):
-                contact = created
+            created = created or {}
+            payload = created.get("payload")
+            contact = (
+                (payload or {}).get("contact")
+                or created.get("contact")
+                or (created if "id" in created else {})
+            )
 
-        # 4) Extract source_id
+        # Extract source_id
+        contact_id = _as_int(contact.get("id"))
         source_id = self._extract_source_id_for_inbox(contact, inbox_id) or search_key
-        logger.info(
+        logger.debug(
             "[chatwoot] ensure_contact ok id=%s inbox=%s source_id=%r",
-            contact.get("id"),
+            contact_id,
             inbox_id,
             source_id,
         )
-        return {"id": int(contact.get("id")), "source_id": source_id}
+        self._remember_contact(cache_key, contact_id, source_id, attrs)
+        return {"id": contact_id, "source_id": source_id}
+
+    @staticmethod
+    def _attrs_contained(
+        existing: Optional[Dict[str, Any]], new: Optional[Dict[str, Any]]
+    ) -> bool:
+        """True if every key in new already has the same value in existing (PATCH would be a no-op)."""
+        if not new:
+            return True
+        if not existing:
+            return False
+        return all(k in existing and existing[k] == v for k, v in new.items())
+
+    @staticmethod
+    def _platform_identifier(custom_attributes: Dict[str, Any]) -> Optional[str]:
+        """Contact identifier (vk:<id> / telegram:<id>) so search can find it later."""
+        vk_user_id = custom_attributes.get("vk_user_id")
+        if vk_user_id:
+            return f"vk:{vk_user_id}"
+        # Identifier para Telegram: permite que search encontre o contacto depois (filter dá 422 em muitas instâncias)
+        telegram_user_id = custom_attributes.get("telegram_user_id")
+        if telegram_user_id:
+            return f"telegram:{telegram_user_id}"
+        return None
 
     def _extract_source_id_for_inbox(
         self, contact: Dict[str, Any], inbox_id: int
     ) -> Optional[str]:
         """Find source_id for a specific inbox in contact_inboxes."""
-        for ci in contact.get("contact_inboxes", []) or []:
-            inbox = (ci or {}).get("inbox") or {}
-            if int(inbox.get("id") or 0) == int(inbox_id):
+        target_id = int(inbox_id)
+        for ci in contact.get("contact_inboxes") or ():
+            if not ci:
+                continue
+            inbox = ci.get("inbox") or {}
+            inbox_key = inbox.get("id")
+            # Chatwoot devolve ids como int; aceitar também strings numéricas
+            if inbox_key == target_id or (
+                isinstance(inbox_key, str) and inbox_key.isdigit() and int(inbox_key) == target_id
+            ):
                 sid = ci.get("source_id")
                 if sid:
                     return sid
@@ -147,27 +446,90 @@ class ChatwootService:
         source_id: str,
         custom_attributes: Optional[Dict[str, Any]] = None,
     ) -> int:
-        res = await self._client.list_conversations(contact_id)
+        conv_key = (int(contact_id), source_id)
+        cached = self._conv_cache.get(conv_key)
+        if cached is not None:
+            if time.monotonic() < cached[1]:
+                self._conv_cache.move_to_end(conv_key)
+                return cached[0]
+            del self._conv_cache[conv_key]
+
+        conv_id = await self._coalesce(
+            ("conversation", conv_key),
+            lambda: self._find_or_create_conversation(
+                inbox_id=inbox_id,
+                contact_id=contact_id,
+                source_id=source_id,
+                custom_attributes=custom_attributes,
+            ),
+        )
+        self._conv_cache[conv_key] = (conv_id, time.monotonic() + CONVERSATION_CACHE_TTL_SEC)
+        self._conv_cache.move_to_end(conv_key)
+        while len(self._conv_cache) > CONVERSATION_CACHE_MAX:
+            self._conv_cache.popitem(last=False)
+        return conv_id
+
+    def invalidate_conversation(self, conversation_id: int) -> None:
+        """Drop cached entries pointing to a conversation (e.g. after it was resolved)."""
+        stale = [k for k, (cid, _) in self._conv_cache.items() if cid == conversation_id]
+        for k in stale:
+            del self._conv_cache[k]
+
+    async def _post_message(
+        self, fn: Callable[..., Awaitable[Dict[str, Any]]], *, conversation_id: int, **kwargs: Any
+    ) -> Dict[str, Any]:
+        """Post to a conversation; 404 means it no longer exists, so it leaves the cache."""
+        try:
+            return await self._call(fn, conversation_id=conversation_id, **kwargs)
+        except httpx.HTTPStatusError as e:
+            if e.response.status_code == 404:
+                self.invalidate_conversation(conversation_id)
+            raise
+
+    async def _find_or_create_conversation(
+        self,
+        *,
+        inbox_id: int,
+        contact_id: int,
+        source_id: str,
+        custom_attributes: Optional[Dict[str, Any]] = None,
+    ) -> int:
+        res = await self._call(
+            self._client.list_conversations,
+            contact_id,
+            idempotent=True,
+            source_id=source_id,
+            inbox_id=inbox_id,
+        )
         conversations = (res or {}).get("payload") or []
 
+        # O servidor pode ignorar os filtros: validar aqui (campos de topo primeiro, o
+        # caminho aninhado em last_non_activity_message só como fallback)
+        target_inbox = int(inbox_id)
         for conv in conversations:
             if conv.get("status") not in ("open", "pending"):
                 continue
-            nested_source_id = (
-                (conv.get("last_non_activity_message") or {})
-                .get("conversation", {})
-                .get("contact_inbox", {})
-                .get("source_id")
-            )
-            if nested_source_id == source_id:
-                logger.info("[chatwoot] reuse conversation id=%s", conv.get("id"))
-                return int(conv["id"])
+            conv_inbox = conv.get("inbox_id")
+            if conv_inbox is not None and conv_inbox != target_inbox:
+                continue
+            conv_source_id = (conv.get("contact_inbox") or {}).get("source_id")
+            if conv_source_id is None:
+                conv_source_id = (
+                    (conv.get("last_non_activity_message") or {})
+                    .get("conversation", {})
+                    .get("contact_inbox", {})
+                    .get("source_id")
+                )
+            if conv_source_id == source_id:
+                logger.debug("[chatwoot] reuse conversation id=%s", conv.get("id"))
+                return _as_int(conv["id"])
 
         extra: Dict[str, Any] = {}
         if custom_attributes:
             extra["custom_attributes"] = custom_attributes
 
-        created = await self._client.create_conversation(
+        created = await self._call(
+            self._client.create_conversation,
             inbox_id=inbox_id,
             source_id=source_id,
             contact_id=contact_id,
@@ -181,7 +543,7 @@ class ChatwootService:
             or payload.get("id")
         )
         logger.info("[chatwoot] create conversation id=%s inbox=%s", conv_id, inbox_id)
-        return int(conv_id)
+        return _as_int(conv_id)
 
     async def create_message(
         self,
@@ -191,14 +553,15 @@ class ChatwootService:
         direction: Literal["incoming", "outgoing"],
     ) -> int:
         message_type = "incoming" if direction == "incoming" else "outgoing"
-        res = await self._client.send_message(
+        res = await self._post_message(
+            self._client.send_message,
             conversation_id=conversation_id,
             content=content or "",
             message_type=message_type,
         )
         msg_id = (res or {}).get("id") or ((res or {}).get("payload") or {}).get("id")
-        logger.info("[chatwoot] create_message id=%s type=%s", msg_id, message_type)
-        return int(msg_id)
+        logger.debug("[chatwoot] create_message id=%s type=%s", msg_id, message_type)
+        return _as_int(msg_id)
 
     async def create_message_with_attachment(
         self,
@@ -211,7 +574,8 @@ class ChatwootService:
     ) -> int:
         """Create message with file attachment (áudio/voice)."""
         message_type = "incoming" if direction == "incoming" else "outgoing"
-        res = await self._client.send_message_with_attachment(
+        res = await self._post_message(
+            self._client.send_message_with_attachment,
             conversation_id=conversation_id,
             content=content or "",
             file_path=file_path,
@@ -226,5 +590,5 @@ class ChatwootService:
                 msg_id = msg[0].get("id")
             elif isinstance(msg, dict):
                 msg_id = msg.get("id")
-        logger.info("[chatwoot] create_message_with_attachment id=%s type=%s", msg_id, message_type)
-        return int(msg_id) if msg_id else 0
+        logger.debug("[chatwoot] create_message_with_attachment id=%s type=%s", msg_id, message_type)
+        return _as_int(msg_id) if msg_id else 0
@@ -1,15 +1,21 @@
+import asyncio
+import functools
 import logging
 import os
 import time
-from typing import Any, Dict, List, Mapping, Optional, Tuple
+from collections import OrderedDict
+from typing import Any, Awaitable, Callable, Dict, List, Mapping, Optional, Set, Tuple
 
 import httpx
-from pyee.asyncio import AsyncIOEventEmitter
+import orjson
 
 from app.application.chatwoot_service import ChatwootService
 from app.application.router import MessageRouter
 from app.config import AppConfig
+from app.infra.bus import EventBus
 from app.infra.chatwoot_client import ChatwootClient
+from app.infra.inflight import Inflight
+from app.infra.retry import retry_on_429
 
 logger = logging.getLogger(__name__)
 
@@ -18,6 +24,68 @@ logger = logging.getLogger(__name__)
 recent_created_outgoing: List[Tuple[int, str, float]] = []
 CREATED_OUTGOING_TTL_SEC = 15.0
 
+# Cliente HTTP partilhado para a API do VK (keep-alive entre eventos; fechado em close_events)
+_vk_http: Optional[httpx.AsyncClient] = None
+# Cliente Chatwoot criado em wire_events (ligação persistente; fechado em close_events)
+_cw_client: Optional[ChatwootClient] = None
+# Filas de eventos por canal (ver _WorkerQueue); drenadas e fechadas em close_events
+EVENT_WORKERS = 16
+EVENT_QUEUE_MAX = 10_000
+# Tempo máximo a esperar no shutdown pelos eventos já aceites (webhooks já responderam 200)
+EVENT_DRAIN_TIMEOUT_SEC = 3.0
+# Fila por evento do bus (wasender.incoming.batch -> fila do WhatsApp); ver event_queue_full
+_queue_by_event: Dict[str, "_WorkerQueue"] = {}
+# Ligações abertas por upstream no arranque (evento app.started)
+PREWARM_CONNECTIONS = 4
+# Limite de pedidos simultâneos ao VK (users.get), separado do limite do Chatwoot
+VK_MAX_CONCURRENCY = 8
+_vk_sem = asyncio.Semaphore(VK_MAX_CONCURRENCY)
+
+# Cache de perfis VK (users.get) por user_id: fresco -> devolve direto; stale -> devolve
+# e atualiza em background; expirado -> espera novo pedido. LRU limitado a N entradas.
+VK_PROFILE_FRESH_SEC = 600.0
+VK_PROFILE_STALE_SEC = 3600.0
+VK_PROFILE_CACHE_MAX = 1000
+_vk_profile_cache: "OrderedDict[str, Tuple[float, Dict[str, Any]]]" = OrderedDict()
+# Pedidos em curso por user_id (eventos paralelos do mesmo user partilham um único users.get)
+_vk_profile_inflight: Inflight[Dict[str, Any]] = Inflight()
+_vk_profile_refresh_tasks: Set["asyncio.Task[Dict[str, Any]]"] = set()
+
+
+def _get_vk_http() -> httpx.AsyncClient:
+    """Return the shared VK API client, creating it on first use."""
+    global _vk_http
+    if _vk_http is None:
+        _vk_http = httpx.AsyncClient(
+            timeout=httpx.Timeout(10.0),
+            limits=httpx.Limits(
+                max_keepalive_connections=20,
+                max_connections=100,
+                keepalive_expiry=30.0,
+            ),
+        )
+    return _vk_http
+
+
+def event_queue_full(event: str) -> bool:
+    """True if the worker queue behind event is full (webhooks answer 503 instead of dropping)."""
+    queue = _queue_by_event.get(event)
+    return queue is not None and queue.full()
+
+
+async def close_events() -> None:
+    """Close HTTP clients owned by the event handlers (called on app shutdown)."""
+    global _vk_http, _cw_client
+    queues = set(_queue_by_event.values())
+    _queue_by_event.clear()
+    await asyncio.gather(*(q.close() for q in queues), return_exceptions=True)
+    if _vk_http is not None:
+        await _vk_http.aclose()
+        _vk_http = None
+    if _cw_client is not None:
+        await _cw_client.aclose()
+        _cw_client = None
+
 
 def register_dispatch_created_outgoing(conversation_id: int, content: str) -> None:
     """
@@ -33,15 +101,22 @@ def register_dispatch_created_outgoing(conversation_id: int, content: str) -> No
     recent_created_outgoing.append((conversation_id, content, now))
 
 
+@retry_on_429(idempotent=True)
+async def _vk_users_get(client: httpx.AsyncClient, params: Dict[str, Any]) -> Any:
+    async with _vk_sem:
+        r = await client.get("https://api.vk.com/method/users.get", params=params)
+        r.raise_for_status()
+        return orjson.loads(r.content)
+
+
 async def _fetch_vk_profile(
-    access_token: str, api_version: str, user_id: str
+    client: httpx.AsyncClient, access_token: str, api_version: str, user_id: str
 ) -> Dict[str, Any]:
     """
     Fetch minimal VK profile data needed for enrichment:
     - first_name, last_name (for contact.name)
     - bdate (for custom attribute vk_bdate)
     """
-    url = "https://api.vk.com/method/users.get"
     params = {
         "user_ids": user_id,
         "fields": "bdate,city,screen_name",
@@ -49,17 +124,65 @@ async def _fetch_vk_profile(
         "v": api_version,
     }
     try:
-        async with httpx.AsyncClient(timeout=10.0) as client:
-            r = await client.get(url, params=params)
-            r.raise_for_status()
-            data = r.json()
-            resp = (data or {}).get("response") or []
-            return resp[0] if resp else {}
-    except Exception as e:
+        data = await _vk_users_get(client, params)
+        resp = (data or {}).get("response") or []
+        return resp[0] if resp else {}
+    except (httpx.HTTPError, ValueError) as e:
         logger.warning("[vk] users.get failed: %s", e)
         return {}
 
 
+async def _refresh_vk_profile(
+    access_token: str, api_version: str, user_id: str
+) -> Dict[str, Any]:
+    """Fetch the profile (coalescing concurrent calls per user_id) and store it in the cache."""
+    return await _vk_profile_inflight.run(
+        user_id, functools.partial(_load_vk_profile, access_token, api_version, user_id)
+    )
+
+
+async def _load_vk_profile(
+    access_token: str, api_version: str, user_id: str
+) -> Dict[str, Any]:
+    profile = await _fetch_vk_profile(
+        client=_get_vk_http(),
+        access_token=access_token,
+        api_version=api_version,
+        user_id=user_id,
+    )
+    if profile:
+        _vk_profile_cache[user_id] = (time.monotonic(), profile)
+        _vk_profile_cache.move_to_end(user_id)
+        while len(_vk_profile_cache) > VK_PROFILE_CACHE_MAX:
+            _vk_profile_cache.popitem(last=False)
+    else:
+        # Falha do users.get: manter o perfil antigo (se houver) em vez de perder o nome
+        cached = _vk_profile_cache.get(user_id)
+        if cached is not None:
+            profile = cached[1]
+    return profile
+
+
+async def _get_vk_profile(
+    access_token: str, api_version: str, user_id: str
+) -> Dict[str, Any]:
+    """Cached users.get lookup with TTL + stale-while-revalidate."""
+    cached = _vk_profile_cache.get(user_id)
+    if cached is not None:
+        ts, profile = cached
+        age = time.monotonic() - ts
+        if age < VK_PROFILE_STALE_SEC:
+            _vk_profile_cache.move_to_end(user_id)
+            if age >= VK_PROFILE_FRESH_SEC and user_id not in _vk_profile_inflight:
+                task = asyncio.create_task(
+                    _refresh_vk_profile(access_token, api_version, user_id)
+                )
+                _vk_profile_refresh_tasks.add(task)
+                task.add_done_callback(_vk_profile_refresh_tasks.discard)
+            return profile
+    return await _refresh_vk_profile(access_token, api_version, user_id)
+
+
 def _normalize_recipient(rid: str) -> str:
     """Normaliza recipient_id para comparação (id:123 -> 123)."""
     rid = (rid or "").strip()
@@ -68,381 +191,630 @@ def _normalize_recipient(rid: str) -> str:
     return rid
 
 
-def wire_events(
-    bus: AsyncIOEventEmitter,
-    config: AppConfig,
-    adapters: Mapping[str, Any],
-    router: MessageRouter,
-) -> None:
+class _WorkerQueue:
     """
-    Register application-level bus handlers.
-    Incoming infra events are normalized and forwarded to ChatwootService.
+    Bounded queue per channel drained by a fixed pool of workers: caps concurrent
+    handlers per adapter (a slow upstream only delays its own channel). submit() is
+    synchronous (called inline by bus.emit) and never waits: when the queue is full the
+    event is dropped with a warning, and webhook endpoints check full() first to answer 503.
+    Workers start on the first submit (inside the running loop); close() drains first.
     """
-    # Cache de envios recentes pelo gateway (webhook Chatwoot) para não duplicar
-    # no Chatwoot quando o handler telegram.outgoing recebe a mesma mensagem
-    recent_gateway_sends: List[Tuple[str, str, float]] = []
-    GATEWAY_SEND_TTL_SEC = 10.0
-
-    @bus.on("telegram.sent_by_gateway")
-    def _record_gateway_send(payload: Dict[str, Any]) -> None:
-        rid = _normalize_recipient((payload.get("to_id") or "").strip())
-        text = (payload.get("text") or "").strip()
-        if rid or text:
-            now = time.monotonic()
-            # Remover entradas expiradas
-            while recent_gateway_sends and now - recent_gateway_sends[0][2] > GATEWAY_SEND_TTL_SEC:
-                recent_gateway_sends.pop(0)
-            if len(recent_gateway_sends) >= 200:
-                recent_gateway_sends.pop(0)
-            recent_gateway_sends.append((rid, text, now))
 
-    cw_client = ChatwootClient(
-        api_access_token=config.chatwoot.api_access_token,
-        account_id=config.chatwoot.account_id,
-        base_url=str(config.chatwoot.base_url),
-    )
-    cw = ChatwootService(client=cw_client)
+    def __init__(
+        self,
+        name: str,
+        handler: Callable[[Dict[str, Any]], Awaitable[None]],
+        workers: int = EVENT_WORKERS,
+        maxsize: int = EVENT_QUEUE_MAX,
+    ):
+        self.name = name
+        self._handler = handler
+        self._workers = workers
+        self._queue: "asyncio.Queue[Dict[str, Any]]" = asyncio.Queue(maxsize=maxsize)
+        self._tasks: List["asyncio.Task[None]"] = []
+
+    def full(self) -> bool:
+        return self._queue.full()
+
+    def submit(self, payload: Dict[str, Any]) -> bool:
+        """Enqueue payload; False (event dropped, attachments removed) if the queue is full."""
+        if not self._tasks:
+            self._tasks = [
+                asyncio.create_task(self._run(), name=f"{self.name}-worker-{i}")
+                for i in range(self._workers)
+            ]
+        try:
+            self._queue.put_nowait(payload)
+        except asyncio.QueueFull:
+            logger.warning("[events] %s queue full, dropping event", self.name)
+            # unlink fora do event loop (submit corre no caminho do webhook)
+            asyncio.get_running_loop().run_in_executor(None, _discard_attachments, payload)
+            return False
+        return True
+
+    async def _run(self) -> None:
+        while True:
+            payload = await self._queue.get()
+            try:
+                await self._handler(payload)
+            except Exception as e:
+                logger.exception("[events] %s worker failed: %s", self.name, e)
+            finally:
+                self._queue.task_done()
 
-    def _inbox_from_adapter(key: str) -> Optional[int]:
-        a = adapters.get(key)
-        return getattr(a, "inbox_id", None)
+    async def close(self, timeout: float = EVENT_DRAIN_TIMEOUT_SEC) -> None:
+        """Process what is already queued (up to timeout), then stop the workers."""
+        if self._tasks and self._queue.qsize():
+            try:
+                await asyncio.wait_for(self._queue.join(), timeout)
+            except asyncio.TimeoutError:
+                logger.warning(
+                    "[events] %s drain timed out, %d event(s) lost",
+                    self.name,
+                    self._queue.qsize(),
+                )
+        for t in self._tasks:
+            t.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks = []
+        # Eventos que ficaram por processar: apagar os ficheiros temporários
+        while not self._queue.empty():
+            await asyncio.to_thread(_discard_attachments, self._queue.get_nowait())
+            self._queue.task_done()
+
+
+def _discard_attachments(payload: Dict[str, Any]) -> None:
+    """Remove temp audio files of an event that will not be processed (blocking: run in a thread)."""
+    for item in payload.get("messages") or (payload,):
+        path = item.get("attachment_path") if isinstance(item, dict) else None
+        if path:
+            try:
+                os.unlink(path)
+            except OSError:
+                pass
 
-    @bus.on("wasender.incoming")
-    async def _ingest_wa(payload: Dict[str, Any]) -> None:
-        try:
-            raw = payload["data"]["messages"]
-            key = raw.get("key", {}) or {}
-            msg = raw.get("message", {}) or {}
-
-            text = (
-                msg.get("conversation")
-                or (msg.get("extendedTextMessage") or {}).get("text")
-                or ""
-            )
-            remote = key.get("remoteJid") or key.get("participant") or ""
-            msisdn = remote.split("@")[0] if "@" in remote else remote
-            push_name = raw.get("pushName") or msisdn
 
-            inbox_id = _inbox_from_adapter("whatsapp")
-            if not inbox_id:
-                raise RuntimeError("WhatsApp inbox_id is not configured")
+# Cache de envios recentes pelo gateway (webhook Chatwoot) para não duplicar
+# no Chatwoot quando o handler telegram.outgoing recebe a mesma mensagem
+recent_gateway_sends: List[Tuple[str, str, float]] = []
+GATEWAY_SEND_TTL_SEC = 10.0
 
-            contact = await cw.ensure_contact(
-                inbox_id=inbox_id,
-                search_key=msisdn,
-                name=push_name,
-                phone=msisdn,
-                email=None,
-                custom_attributes={"wa_remote_jid": remote},
-            )
-            conv_id = await cw.ensure_conversation(
-                inbox_id=inbox_id,
-                contact_id=contact["id"],
-                source_id=msisdn,
-            )
-            await cw.create_message(
-                conversation_id=conv_id,
-                content=(text or "").strip(),
-                direction="incoming",
-            )
-            logger.info(
-                "[events] wa -> chatwoot OK conv_id=%s inbox=%s", conv_id, inbox_id
-            )
-        except Exception as e:
-            logger.exception("[events] wasender handling failed: %s", e)
-
-    @bus.on("vk.incoming")
-    async def _ingest_vk(payload: Dict[str, Any]) -> None:
-        """
-        VK (Callback API) incoming:
-        - enrich contact with name (first+last; fallback to screen_name) and bdate
-        - custom_attributes: vk_user_id, vk_peer_id, vk_bdate (if present)
-        - additional_attributes: city (if present in users.get)
-        - rely on ensure_contact() to find by /contacts/filter
-        """
-        try:
-            message = payload.get("message") or {}
-            text = (message.get("text") or "").strip()
-            peer_id = str(message.get("peer_id") or "")
-            from_id = str(message.get("from_id") or peer_id)
-
-            # Enrich with profile
-            vk_name: Optional[str] = None
-            vk_bdate: Optional[str] = None
-            additional_attributes: Dict[str, Any] = {}
-
-            if config.vk:
-                profile = await _fetch_vk_profile(
-                    access_token=config.vk.access_token,
-                    api_version=config.vk.api_version,
-                    user_id=from_id,
-                )
-                first = (profile.get("first_name") or "").strip()
-                last = (profile.get("last_name") or "").strip()
-                screen_name = (profile.get("screen_name") or "").strip()
-                vk_bdate = (profile.get("bdate") or "").strip() or None
-
-                # Extract city from profile; VK may return dict with "title" or a plain string
-                city_info = profile.get("city")
-                city_name: Optional[str] = None
-                if isinstance(city_info, dict):
-                    city_name = (city_info.get("title") or "").strip() or None
-                elif isinstance(city_info, str):
-                    city_name = city_info.strip() or None
-                if city_name:
-                    additional_attributes["city"] = city_name
-
-                if first or last:
-                    vk_name = f"{first} {last}".strip()
-                elif screen_name:
-                    vk_name = screen_name
-
-            inbox_id = getattr(adapters.get("vk"), "inbox_id", None)
-            if not inbox_id:
-                raise RuntimeError("VK inbox_id is not configured")
-
-            custom_attributes = {"vk_user_id": from_id, "vk_peer_id": peer_id}
-            if vk_bdate:
-                custom_attributes["vk_bdate"] = vk_bdate
-
-            # Let ensure_contact handle attribute-first lookup
-            ensured = await cw.ensure_contact(
+
+def _record_gateway_send(payload: Dict[str, Any]) -> None:
+    rid = _normalize_recipient((payload.get("to_id") or "").strip())
+    text = (payload.get("text") or "").strip()
+    if rid or text:
+        now = time.monotonic()
+        # Remover entradas expiradas
+        while recent_gateway_sends and now - recent_gateway_sends[0][2] > GATEWAY_SEND_TTL_SEC:
+            recent_gateway_sends.pop(0)
+        if len(recent_gateway_sends) >= 200:
+            recent_gateway_sends.pop(0)
+        recent_gateway_sends.append((rid, text, now))
+
+
+async def _prewarm_connections(
+    cw_client: ChatwootClient, vk_enabled: bool, _: Any = None
+) -> None:
+    # Handshakes TLS antes do primeiro evento: N ligações em paralelo para cada upstream
+    tasks = [cw_client.prewarm(connections=PREWARM_CONNECTIONS)]
+    if vk_enabled:
+        vk_http = _get_vk_http()
+        tasks.extend(vk_http.head("https://api.vk.com/") for _ in range(PREWARM_CONNECTIONS))
+    await asyncio.gather(*tasks, return_exceptions=True)
+    logger.debug("[events] upstream connections prewarmed")
+
+
+async def _ingest_wa(
+    cw: ChatwootService, inbox_id: Optional[int], payload: Dict[str, Any]
+) -> None:
+    try:
+        raw = payload["data"]["messages"]
+        key = raw.get("key", {}) or {}
+        msg = raw.get("message", {}) or {}
+
+        text = (
+            msg.get("conversation")
+            or (msg.get("extendedTextMessage") or {}).get("text")
+            or ""
+        )
+        remote = key.get("remoteJid") or key.get("participant") or ""
+        msisdn = remote.partition("@")[0]
+        push_name = raw.get("pushName") or msisdn
+
+        if not inbox_id:
+            raise RuntimeError("WhatsApp inbox_id is not configured")
+
+        contact = await cw.ensure_contact(
+            inbox_id=inbox_id,
+            search_key=msisdn,
+            name=push_name,
+            phone=msisdn,
+            email=None,
+            custom_attributes={"wa_remote_jid": remote},
+        )
+        conv_id = await cw.ensure_conversation(
+            inbox_id=inbox_id,
+            contact_id=contact["id"],
+            source_id=msisdn,
+        )
+        await cw.create_message(
+            conversation_id=conv_id,
+            content=(text or "").strip(),
+            direction="incoming",
+        )
+        logger.info(
+            "[events] wa -> chatwoot OK conv_id=%s inbox=%s", conv_id, inbox_id
+        )
+    except Exception as e:
+        logger.exception("[events] wasender handling failed: %s", e)
+
+
+def _split_wa_batch(payload: Dict[str, Any]) -> List[Dict[str, Any]]:
+    """Split a multi-message upsert into single-message payloads (fromMe echoes dropped)."""
+    data = payload.get("data") or {}
+    items: List[Dict[str, Any]] = []
+    for raw in data.get("messages") or ():
+        if not isinstance(raw, dict) or (raw.get("key") or {}).get("fromMe"):
+            continue
+        items.append({**payload, "data": {**data, "messages": raw}})
+    return items
+
+
+def _ingest_wa_batch(queue: "_WorkerQueue", payload: Dict[str, Any]) -> None:
+    # Um emit para o lote inteiro; cada mensagem segue para a fila do WhatsApp
+    for item in _split_wa_batch(payload):
+        queue.submit(item)
+
+
+async def _ingest_vk(
+    cw: ChatwootService,
+    inbox_id: Optional[int],
+    vk_profile: Optional[Callable[..., Awaitable[Dict[str, Any]]]],
+    payload: Dict[str, Any],
+) -> None:
+    """
+    VK (Callback API) incoming:
+    - enrich contact with name (first+last; fallback to screen_name) and bdate
+    - custom_attributes: vk_user_id, vk_peer_id, vk_bdate (if present)
+    - additional_attributes: city (if present in users.get)
+    - rely on lookup_contact() to find by /contacts/filter
+    - users.get and the Chatwoot lookup run concurrently (the lookup only needs vk_user_id)
+    """
+    try:
+        message = payload.get("message") or {}
+        text = (message.get("text") or "").strip()
+        peer_id = str(message.get("peer_id") or "")
+        from_id = str(message.get("from_id") or peer_id)
+
+        if not inbox_id:
+            raise RuntimeError("VK inbox_id is not configured")
+
+        profile_coro = (
+            vk_profile(user_id=from_id) if vk_profile else asyncio.sleep(0, result={})
+        )
+        profile, contact = await asyncio.gather(
+            profile_coro,
+            cw.lookup_contact(
                 inbox_id=inbox_id,
                 search_key=from_id,
-                name=vk_name or from_id,
-                phone=None,
-                email=None,
-                custom_attributes=custom_attributes,
-                additional_attributes=additional_attributes,  # pass city here
-            )
+                custom_attributes={"vk_user_id": from_id},
+            ),
+        )
+
+        # Enrich with profile
+        vk_name: Optional[str] = None
+        vk_bdate: Optional[str] = None
+        additional_attributes: Dict[str, Any] = {}
+
+        if profile:
+            first = (profile.get("first_name") or "").strip()
+            last = (profile.get("last_name") or "").strip()
+            screen_name = (profile.get("screen_name") or "").strip()
+            vk_bdate = (profile.get("bdate") or "").strip() or None
+
+            # Extract city from profile; VK may return dict with "title" or a plain string
+            city_info = profile.get("city")
+            city_name: Optional[str] = None
+            if isinstance(city_info, dict):
+                city_name = (city_info.get("title") or "").strip() or None
+            elif isinstance(city_info, str):
+                city_name = city_info.strip() or None
+            if city_name:
+                additional_attributes["city"] = city_name
+
+            if first or last:
+                vk_name = f"{first} {last}".strip()
+            elif screen_name:
+                vk_name = screen_name
+
+        custom_attributes = {"vk_user_id": from_id, "vk_peer_id": peer_id}
+        if vk_bdate:
+            custom_attributes["vk_bdate"] = vk_bdate
+
+        ensured = await cw.upsert_contact(
+            contact,
+            inbox_id=inbox_id,
+            search_key=from_id,
+            name=vk_name or from_id,
+            phone=None,
+            email=None,
+            custom_attributes=custom_attributes,
+            additional_attributes=additional_attributes,  # pass city here
+        )
+
+        conv_id = await cw.ensure_conversation(
+            inbox_id=inbox_id,
+            contact_id=ensured["id"],
+            source_id=ensured["source_id"],
+        )
+        await cw.create_message(
+            conversation_id=conv_id,
+            content=text,
+            direction="incoming",
+        )
+        logger.info(
+            "[events] vk -> chatwoot OK conv_id=%s inbox=%s", conv_id, inbox_id
+        )
+    except Exception as e:
+        logger.exception("[events] vk handling failed: %s", e)
 
-            conv_id = await cw.ensure_conversation(
-                inbox_id=inbox_id,
-                contact_id=ensured["id"],
-                source_id=ensured["source_id"],
+
+async def _vk_confirm(ev: Dict[str, Any]) -> None:
+    logger.info("[vk] confirmation acknowledged: group_id=%s", ev.get("group_id"))
+
+
+async def _chatwoot_status_changed(cw: ChatwootService, payload: Dict[str, Any]) -> None:
+    # Conversa resolvida/adiada: deixa de ser reutilizável, limpar do cache
+    if payload.get("status") in ("open", "pending"):
+        return
+    try:
+        cw.invalidate_conversation(int(payload.get("id")))
+    except (TypeError, ValueError):
+        pass
+
+
+async def _chatwoot_contact_updated(router: MessageRouter, payload: Dict[str, Any]) -> None:
+    # Atributos do contato mudaram: recipient_id em cache pode estar desatualizado
+    router.invalidate_contact(payload.get("id"))
+
+
+async def _chatwoot_outgoing(router: MessageRouter, payload: Dict[str, Any]) -> None:
+    # Se esta mensagem outgoing foi criada por nós (sync do Telegram), não reenviar ao Telegram
+    conv_id_raw = (payload.get("conversation") or {}).get("id")
+    content = (payload.get("content") or "").strip()
+    try:
+        conv_id = int(conv_id_raw) if conv_id_raw is not None else None
+    except (TypeError, ValueError):
+        conv_id = None
+    if conv_id is not None:
+        now = time.monotonic()
+        for i, (cid, txt, ts) in enumerate(recent_created_outgoing):
+            if now - ts > CREATED_OUTGOING_TTL_SEC:
+                continue
+            if cid == conv_id and txt == content:
+                recent_created_outgoing.pop(i)
+                logger.debug(
+                    "[events] chatwoot.outgoing ignorado (msg criada por nós): conv_id=%s",
+                    conv_id,
+                )
+                return
+        # limpar entradas expiradas no início
+        while recent_created_outgoing and now - recent_created_outgoing[0][2] > CREATED_OUTGOING_TTL_SEC:
+            recent_created_outgoing.pop(0)
+    await router.handle_outgoing(payload)
+
+
+async def _telegram_incoming_conversation(
+    cw: ChatwootService, inbox_id: Optional[int], payload: Dict[str, Any]
+) -> int:
+    """Search or upsert the sender's contact and return its conversation id."""
+    from_id = str(payload.get("from_id") or "")
+    username = payload.get("username")
+    name = payload.get("name") or username or from_id
+
+    if not inbox_id:
+        raise RuntimeError("Telegram inbox_id is not configured")
+
+    # Build custom_attributes for Chatwoot contact lookup
+    custom_attributes = {}
+    if from_id:
+        custom_attributes["telegram_user_id"] = from_id
+    if username:
+        custom_attributes["telegram_username"] = username
+
+    # Use username as search_key if available, else from_id
+    search_key = username or from_id
+
+    # Upsert contact in Chatwoot
+    contact = await cw.ensure_contact(
+        inbox_id=inbox_id,
+        search_key=search_key,
+        name=name,
+        phone=None,
+        email=None,
+        custom_attributes=custom_attributes,
+    )
+
+    # Use source_id returned by ensure_contact (should be user_id or username)
+    return await cw.ensure_conversation(
+        inbox_id=inbox_id,
+        contact_id=contact["id"],
+        source_id=contact["source_id"],
+    )
+
+
+async def _create_telegram_incoming(
+    cw: ChatwootService, conv_id: int, payload: Dict[str, Any]
+) -> None:
+    """Create one incoming message (text or audio attachment) in the conversation."""
+    text = (payload.get("text") or "").strip()
+    attachment_path = payload.get("attachment_path")
+    attachment_content_type = payload.get("attachment_content_type")
+    # stat/unlink fora do event loop (o ficheiro pode estar num volume lento)
+    has_attachment = bool(attachment_path) and await asyncio.to_thread(
+        os.path.isfile, attachment_path
+    )
+    try:
+        if has_attachment:
+            await cw.create_message_with_attachment(
+                conversation_id=conv_id,
+                content=text or "",
+                file_path=attachment_path,
+                direction="incoming",
+                content_type=attachment_content_type,
             )
+        else:
             await cw.create_message(
                 conversation_id=conv_id,
                 content=text,
                 direction="incoming",
             )
-            logger.info(
-                "[events] vk -> chatwoot OK conv_id=%s inbox=%s", conv_id, inbox_id
-            )
-        except Exception as e:
-            logger.exception("[events] vk handling failed: %s", e)
+    finally:
+        if has_attachment:
+            try:
+                await asyncio.to_thread(os.unlink, attachment_path)
+            except OSError:
+                pass
 
-    @bus.on("vk.confirmation")
-    async def _vk_confirm(ev: Dict[str, Any]) -> None:
-        logger.info("[vk] confirmation acknowledged: group_id=%s", ev.get("group_id"))
 
-    @bus.on("chatwoot.outgoing")
-    async def _chatwoot_outgoing(payload: Dict[str, Any]) -> None:
-        # Se esta mensagem outgoing foi criada por nós (sync do Telegram), não reenviar ao Telegram
-        conv_id_raw = (payload.get("conversation") or {}).get("id")
-        content = (payload.get("content") or "").strip()
-        try:
-            conv_id = int(conv_id_raw) if conv_id_raw is not None else None
-        except (TypeError, ValueError):
-            conv_id = None
-        if conv_id is not None:
-            now = time.monotonic()
-            for i, (cid, txt, ts) in enumerate(recent_created_outgoing):
-                if now - ts > CREATED_OUTGOING_TTL_SEC:
-                    continue
-                if cid == conv_id and txt == content:
-                    recent_created_outgoing.pop(i)
-                    logger.debug(
-                        "[events] chatwoot.outgoing ignorado (msg criada por nós): conv_id=%s",
-                        conv_id,
-                    )
-                    return
-            # limpar entradas expiradas no início
-            while recent_created_outgoing and now - recent_created_outgoing[0][2] > CREATED_OUTGOING_TTL_SEC:
-                recent_created_outgoing.pop(0)
-        await router.handle_outgoing(payload)
-
-    @bus.on("telegram.incoming")
-    async def _ingest_telegram(payload: Dict[str, Any]) -> None:
-        """
-        Handle incoming Telegram message and forward it to Chatwoot.
-        - Search or upsert contact using telegram_user_id and telegram_username.
-        - Ensure conversation by source_id (user_id or username).
-        - Create incoming message in Chatwoot.
-        """
-        try:
-            text = (payload.get("text") or "").strip()
-            from_id = str(payload.get("from_id") or "")
-            username = payload.get("username")
-            name = payload.get("name") or username or from_id
-
-            inbox_id = _inbox_from_adapter("telegram")
-            if not inbox_id:
-                raise RuntimeError("Telegram inbox_id is not configured")
-
-            # Build custom_attributes for Chatwoot contact lookup
-            custom_attributes = {}
-            if from_id:
-                custom_attributes["telegram_user_id"] = from_id
-            if username:
-                custom_attributes["telegram_username"] = username
-
-            # Use username as search_key if available, else from_id
-            search_key = username or from_id
-
-            # Upsert contact in Chatwoot
-            contact = await cw.ensure_contact(
-                inbox_id=inbox_id,
-                search_key=search_key,
-                name=name,
-                phone=None,
-                email=None,
-                custom_attributes=custom_attributes,
-            )
+async def _ingest_telegram(
+    cw: ChatwootService, inbox_id: Optional[int], payload: Dict[str, Any]
+) -> None:
+    """
+    Handle incoming Telegram message and forward it to Chatwoot.
+    - Search or upsert contact using telegram_user_id and telegram_username.
+    - Ensure conversation by source_id (user_id or username).
+    - Create incoming message in Chatwoot.
+    """
+    try:
+        conv_id = await _telegram_incoming_conversation(cw, inbox_id, payload)
+        await _create_telegram_incoming(cw, conv_id, payload)
+        logger.info(
+            "[events] telegram -> chatwoot OK conv_id=%s inbox=%s",
+            conv_id,
+            inbox_id,
+        )
+    except Exception as e:
+        logger.exception("[events] telegram handling failed: %s", e)
 
-            # Use source_id returned by ensure_contact (should be user_id or username)
-            conv_id = await cw.ensure_conversation(
-                inbox_id=inbox_id,
-                contact_id=contact["id"],
-                source_id=contact["source_id"],
-            )
 
-            attachment_path = payload.get("attachment_path")
-            attachment_content_type = payload.get("attachment_content_type")
-            try:
-                if attachment_path and os.path.isfile(attachment_path):
-                    await cw.create_message_with_attachment(
-                        conversation_id=conv_id,
-                        content=text or "",
-                        file_path=attachment_path,
-                        direction="incoming",
-                        content_type=attachment_content_type,
-                    )
-                else:
-                    await cw.create_message(
-                        conversation_id=conv_id,
-                        content=text,
-                        direction="incoming",
-                    )
-            finally:
-                if attachment_path and os.path.isfile(attachment_path):
-                    try:
-                        os.unlink(attachment_path)
-                    except OSError:
-                        pass
-
-            logger.info(
-                "[events] telegram -> chatwoot OK conv_id=%s inbox=%s",
-                conv_id,
-                inbox_id,
-            )
+async def _ingest_telegram_batch(
+    cw: ChatwootService, inbox_id: Optional[int], payload: Dict[str, Any]
+) -> None:
+    """
+    Burst of incoming messages from one Telegram user (see TelegramAdapter._queue_incoming):
+    contact/conversation resolved once, messages created in arrival order.
+    """
+    messages = payload.get("messages") or []
+    if not messages:
+        return
+    try:
+        conv_id = await _telegram_incoming_conversation(cw, inbox_id, messages[-1])
+    except Exception as e:
+        logger.exception("[events] telegram handling failed: %s", e)
+        for message in messages:
+            path = message.get("attachment_path")
+            if path:
+                try:
+                    await asyncio.to_thread(os.unlink, path)
+                except OSError:
+                    pass
+        return
+    for message in messages:
+        try:
+            await _create_telegram_incoming(cw, conv_id, message)
         except Exception as e:
             logger.exception("[events] telegram handling failed: %s", e)
+            continue
+        logger.info(
+            "[events] telegram -> chatwoot OK conv_id=%s inbox=%s",
+            conv_id,
+            inbox_id,
+        )
 
-    @bus.on("telegram.outgoing")
-    async def _ingest_telegram_outgoing(payload: Dict[str, Any]) -> None:
-        """
-        Mensagens enviadas por ti no Telegram (disparos) -> Chatwoot como outgoing.
-        O contacto é o destinatário (to_id); a mensagem aparece como enviada pelo agente.
-        Se a mensagem foi enviada pelo gateway (webhook Chatwoot), não duplicamos no Chatwoot.
-        """
-        try:
-            text = (payload.get("text") or "").strip()
-            to_id = str(payload.get("to_id") or "")
-            username = payload.get("username")
-            name = payload.get("name") or username or to_id
 
-            # Evitar duplicar no Chatwoot quando o envio veio do webhook (Chatwoot já tem a msg)
-            now = time.monotonic()
-            norm_to = _normalize_recipient(to_id)
-            skip = False
-            for i, (rid, txt, ts) in enumerate(recent_gateway_sends):
-                if now - ts > GATEWAY_SEND_TTL_SEC:
-                    continue
-                if (rid == norm_to or rid == to_id) and txt == text:
-                    skip = True
-                    recent_gateway_sends.pop(i)
-                    break
-            if skip:
+async def _ingest_telegram_outgoing(
+    cw: ChatwootService, inbox_id: Optional[int], payload: Dict[str, Any]
+) -> None:
+    """
+    Mensagens enviadas por ti no Telegram (disparos) -> Chatwoot como outgoing.
+    O contacto é o destinatário (to_id); a mensagem aparece como enviada pelo agente.
+    Se a mensagem foi enviada pelo gateway (webhook Chatwoot), não duplicamos no Chatwoot.
+    """
+    try:
+        text = (payload.get("text") or "").strip()
+        to_id = str(payload.get("to_id") or "")
+        username = payload.get("username")
+        name = payload.get("name") or username or to_id
+
+        # Evitar duplicar no Chatwoot quando o envio veio do webhook (Chatwoot já tem a msg)
+        now = time.monotonic()
+        norm_to = _normalize_recipient(to_id)
+        skip = False
+        for i, (rid, txt, ts) in enumerate(recent_gateway_sends):
+            if now - ts > GATEWAY_SEND_TTL_SEC:
+                continue
+            if (rid == norm_to or rid == to_id) and txt == text:
+                skip = True
+                recent_gateway_sends.pop(i)
+                break
+        if skip:
+            logger.debug(
+                "[events] telegram.outgoing ignorado (enviado pelo gateway): to_id=%s",
+                to_id,
+            )
+            return
+
+        if not inbox_id:
+            raise RuntimeError("Telegram inbox_id is not configured")
+
+        custom_attributes = {}
+        if to_id:
+            custom_attributes["telegram_user_id"] = to_id
+        if username:
+            custom_attributes["telegram_username"] = username
+        search_key = username or to_id
+
+        contact = await cw.ensure_contact(
+            inbox_id=inbox_id,
+            search_key=search_key,
+            name=name,
+            phone=None,
+            email=None,
+            custom_attributes=custom_attributes,
+        )
+
+        conv_id = await cw.ensure_conversation(
+            inbox_id=inbox_id,
+            contact_id=contact["id"],
+            source_id=contact["source_id"],
+        )
+
+        # Evitar duplicar quando chegam dois eventos (ex.: emit manual do /dispatch + evento Telethon)
+        now = time.monotonic()
+        for (cid, txt, ts) in recent_created_outgoing:
+            if now - ts > CREATED_OUTGOING_TTL_SEC:
+                continue
+            if cid == conv_id and txt == (text or ""):
                 logger.debug(
-                    "[events] telegram.outgoing ignorado (enviado pelo gateway): to_id=%s",
-                    to_id,
+                    "[events] telegram.outgoing já criado: conv_id=%s text=%r",
+                    conv_id,
+                    (text or "")[:50],
                 )
                 return
 
-            inbox_id = _inbox_from_adapter("telegram")
-            if not inbox_id:
-                raise RuntimeError("Telegram inbox_id is not configured")
+        attachment_path = payload.get("attachment_path")
+        attachment_content_type = payload.get("attachment_content_type")
+        # stat/unlink fora do event loop (o ficheiro pode estar num volume lento)
+        has_attachment = bool(attachment_path) and await asyncio.to_thread(
+            os.path.isfile, attachment_path
+        )
+        try:
+            if has_attachment:
+                await cw.create_message_with_attachment(
+                    conversation_id=conv_id,
+                    content=text or "",
+                    file_path=attachment_path,
+                    direction="outgoing",
+                    content_type=attachment_content_type,
+                )
+            else:
+                await cw.create_message(
+                    conversation_id=conv_id,
+                    content=text,
+                    direction="outgoing",
+                )
+            # Registrar para não reenviar ao Telegram quando o Chatwoot disparar o webhook
+            now = time.monotonic()
+            while recent_created_outgoing and now - recent_created_outgoing[0][2] > CREATED_OUTGOING_TTL_SEC:
+                recent_created_outgoing.pop(0)
+            if len(recent_created_outgoing) >= 200:
+                recent_created_outgoing.pop(0)
+            recent_created_outgoing.append((conv_id, text or "", now))
+        finally:
+            if has_attachment:
+                try:
+                    await asyncio.to_thread(os.unlink, attachment_path)
+                except OSError:
+                    pass
+
+        logger.info(
+            "[events] telegram outgoing (disparo) -> chatwoot OK conv_id=%s",
+            conv_id,
+        )
+    except Exception as e:
+        logger.exception("[events] telegram outgoing handling failed: %s", e)
 
-            custom_attributes = {}
-            if to_id:
-                custom_attributes["telegram_user_id"] = to_id
-            if username:
-                custom_attributes["telegram_username"] = username
-            search_key = username or to_id
 
-            contact = await cw.ensure_contact(
-                inbox_id=inbox_id,
-                search_key=search_key,
-                name=name,
-                phone=None,
-                email=None,
-                custom_attributes=custom_attributes,
-            )
+def wire_events(
+    bus: EventBus,
+    config: AppConfig,
+    adapters: Mapping[str, Any],
+    router: MessageRouter,
+) -> None:
+    """
+    Register application-level bus handlers.
+    Incoming infra events are normalized and forwarded to ChatwootService.
+    Handlers are module-level functions; their dependencies are pre-bound with functools.partial.
+    """
+    global _cw_client
+    cw_client = ChatwootClient(
+        api_access_token=config.chatwoot.api_access_token,
+        account_id=config.chatwoot.account_id,
+        base_url=str(config.chatwoot.base_url),
+        http2=True,
+        limits=httpx.Limits(
+            max_keepalive_connections=20,
+            max_connections=100,
+            keepalive_expiry=30.0,
+        ),
+    )
+    _cw_client = cw_client
+    cw = ChatwootService(client=cw_client)
 
-            conv_id = await cw.ensure_conversation(
-                inbox_id=inbox_id,
-                contact_id=contact["id"],
-                source_id=contact["source_id"],
-            )
+    def _inbox_from_adapter(key: str) -> Optional[int]:
+        a = adapters.get(key)
+        return getattr(a, "inbox_id", None)
 
-            # Evitar duplicar quando chegam dois eventos (ex.: emit manual do /dispatch + evento Telethon)
-            now = time.monotonic()
-            for (cid, txt, ts) in recent_created_outgoing:
-                if now - ts > CREATED_OUTGOING_TTL_SEC:
-                    continue
-                if cid == conv_id and txt == (text or ""):
-                    logger.debug(
-                        "[events] telegram.outgoing já criado: conv_id=%s text=%r",
-                        conv_id,
-                        (text or "")[:50],
-                    )
-                    return
-
-            attachment_path = payload.get("attachment_path")
-            attachment_content_type = payload.get("attachment_content_type")
-            try:
-                if attachment_path and os.path.isfile(attachment_path):
-                    await cw.create_message_with_attachment(
-                        conversation_id=conv_id,
-                        content=text or "",
-                        file_path=attachment_path,
-                        direction="outgoing",
-                        content_type=attachment_content_type,
-                    )
-                else:
-                    await cw.create_message(
-                        conversation_id=conv_id,
-                        content=text,
-                        direction="outgoing",
-                    )
-                # Registrar para não reenviar ao Telegram quando o Chatwoot disparar o webhook
-                now = time.monotonic()
-                while recent_created_outgoing and now - recent_created_outgoing[0][2] > CREATED_OUTGOING_TTL_SEC:
-                    recent_created_outgoing.pop(0)
-                if len(recent_created_outgoing) >= 200:
-                    recent_created_outgoing.pop(0)
-                recent_created_outgoing.append((conv_id, text or "", now))
-            finally:
-                if attachment_path and os.path.isfile(attachment_path):
-                    try:
-                        os.unlink(attachment_path)
-                    except OSError:
-                        pass
-
-            logger.info(
-                "[events] telegram outgoing (disparo) -> chatwoot OK conv_id=%s",
-                conv_id,
-            )
-        except Exception as e:
-            logger.exception("[events] telegram outgoing handling failed: %s", e)
+    # Valores fixos por canal resolvidos uma vez (inbox_id vem da config do adapter)
+    wa_inbox_id = _inbox_from_adapter("whatsapp")
+    vk_inbox_id = _inbox_from_adapter("vk")
+    tg_inbox_id = _inbox_from_adapter("telegram")
+    vk_profile = (
+        functools.partial(
+            _get_vk_profile,
+            access_token=config.vk.access_token,
+            api_version=config.vk.api_version,
+        )
+        if config.vk
+        else None
+    )
+
+    bus.on("telegram.sent_by_gateway", _record_gateway_send)
+    bus.on("app.started", functools.partial(_prewarm_connections, cw_client, bool(config.vk)))
+    bus.on("vk.confirmation", _vk_confirm)
+    bus.on(
+        "chatwoot.conversation_status_changed",
+        functools.partial(_chatwoot_status_changed, cw),
+    )
+    bus.on("chatwoot.outgoing", functools.partial(_chatwoot_outgoing, router))
+    bus.on("chatwoot.contact_updated", functools.partial(_chatwoot_contact_updated, router))
+
+    # Ingestão por canal: cada evento entra na fila do seu canal (workers limitados)
+    queues = _queue_by_event
+    for event, handler in (
+        ("wasender.incoming", functools.partial(_ingest_wa, cw, wa_inbox_id)),
+        ("vk.incoming", functools.partial(_ingest_vk, cw, vk_inbox_id, vk_profile)),
+        ("telegram.incoming", functools.partial(_ingest_telegram, cw, tg_inbox_id)),
+        ("telegram.incoming.batch", functools.partial(_ingest_telegram_batch, cw, tg_inbox_id)),
+        ("telegram.outgoing", functools.partial(_ingest_telegram_outgoing, cw, tg_inbox_id)),
+    ):
+        queue = _WorkerQueue(event, handler)
+        queues[event] = queue
+        bus.on(event, queue.submit)
+    queues["wasender.incoming.batch"] = queues["wasender.incoming"]
+    bus.on(
+        "wasender.incoming.batch",
+        functools.partial(_ingest_wa_batch, queues["wasender.incoming"]),
+    )
@@ -0,0 +1,130 @@
+import asyncio
+from collections import Counter
+from typing import Awaitable, Callable, Dict, List, Mapping, Optional, Set, Tuple
+
+# Janela de agregação e tamanho máximo do lote (VK messages.send aceita até 100 peer_ids)
+OUTBOUND_BATCH_WINDOW_SEC = 0.05
+OUTBOUND_BATCH_MAX = 100
+
+SendOne = Callable[[str, str], Awaitable[None]]
+# Devolve as falhas por destinatário (recipient_id -> erro); vazio = todos enviados
+SendMany = Callable[[List[str], str], Awaitable[Mapping[str, str]]]
+_Pending = Tuple[str, str, "asyncio.Future[None]"]
+
+
+class OutboundBatcher:
+    """
+    Batches outgoing texts for one channel: a send with nothing pending goes out at once
+    and opens a short window; sends arriving inside it are flushed together with the
+    adapter's bulk send, so the same text to several recipients goes out in a single call
+    (e.g. a Chatwoot campaign). Recipients with more than one pending message are sent one
+    by one, in order, after any direct send to them still in flight.
+    """
+
+    def __init__(
+        self,
+        send_one: SendOne,
+        send_many: SendMany,
+        window: float = OUTBOUND_BATCH_WINDOW_SEC,
+        max_items: int = OUTBOUND_BATCH_MAX,
+    ):
+        self._send_one = send_one
+        self._send_many = send_many
+        self._window = window
+        self._max_items = max_items
+        self._pending: List[_Pending] = []
+        self._timer: Optional[asyncio.TimerHandle] = None
+        self._flush_tasks: Set["asyncio.Task[None]"] = set()
+        # Envios diretos em curso por destinatário (o lote seguinte espera por eles)
+        self._direct: Dict[str, "asyncio.Future[None]"] = {}
+
+    async def send(self, recipient_id: str, text: str) -> None:
+        """Send a text, batched with others inside the window; failures are raised."""
+        loop = asyncio.get_running_loop()
+        if self._timer is None:
+            # Nada pendente: enviar já e abrir a janela para juntar os envios seguintes
+            self._timer = loop.call_later(self._window, self._flush_now)
+            await self._send_direct(recipient_id, text)
+            return
+        fut: "asyncio.Future[None]" = loop.create_future()
+        self._pending.append((recipient_id, text, fut))
+        if len(self._pending) >= self._max_items:
+            self._flush_now()
+        await fut
+
+    async def _send_direct(self, recipient_id: str, text: str) -> None:
+        done: "asyncio.Future[None]" = asyncio.get_running_loop().create_future()
+        self._direct[recipient_id] = done
+        try:
+            await self._send_one(recipient_id, text)
+        finally:
+            done.set_result(None)
+            if self._direct.get(recipient_id) is done:
+                del self._direct[recipient_id]
+
+    async def _after_direct(self, recipient_ids: List[str]) -> None:
+        """Wait for direct sends to these recipients that are still in flight."""
+        waiting = [self._direct[rid] for rid in recipient_ids if rid in self._direct]
+        if waiting:
+            await asyncio.wait(waiting)
+
+    def _flush_now(self) -> None:
+        if self._timer is not None:
+            self._timer.cancel()
+            self._timer = None
+        batch, self._pending = self._pending, []
+        if not batch:
+            return
+        task = asyncio.create_task(self._flush(batch))
+        self._flush_tasks.add(task)
+        task.add_done_callback(self._flush_tasks.discard)
+
+    async def _flush(self, batch: List[_Pending]) -> None:
+        counts = Counter(rid for rid, _, _ in batch)
+        by_text: Dict[str, List[_Pending]] = {}
+        by_recipient: Dict[str, List[_Pending]] = {}
+        for item in batch:
+            if counts[item[0]] == 1:
+                by_text.setdefault(item[1], []).append(item)
+            else:
+                by_recipient.setdefault(item[0], []).append(item)
+
+        jobs = [self._send_group(text, items) for text, items in by_text.items()]
+        jobs.extend(self._send_in_order(items) for items in by_recipient.values())
+        await asyncio.gather(*jobs)
+
+    async def _send_group(self, text: str, items: List[_Pending]) -> None:
+        recipient_ids = [rid for rid, _, _ in items]
+        failed: Mapping[str, str] = {}
+        try:
+            await self._after_direct(recipient_ids)
+            if len(items) == 1:
+                await self._send_one(recipient_ids[0], text)
+            else:
+                failed = await self._send_many(recipient_ids, text)
+        except Exception as e:
+            for _, _, fut in items:
+                _resolve(fut, e)
+            return
+        for rid, _, fut in items:
+            error = failed.get(rid)
+            _resolve(fut, None if error is None else RuntimeError(error))
+
+    async def _send_in_order(self, items: List[_Pending]) -> None:
+        await self._after_direct([items[0][0]])
+        for rid, text, fut in items:
+            try:
+                await self._send_one(rid, text)
+            except Exception as e:
+                _resolve(fut, e)
+            else:
+                _resolve(fut, None)
+
+
+def _resolve(fut: "asyncio.Future[None]", error: Optional[BaseException]) -> None:
+    if fut.done():
+        return
+    if error is None:
+        fut.set_result(None)
+    else:
+        fut.set_exception(error)
@@ -1,55 +1,120 @@
 import asyncio
 import logging
-from typing import Any, Dict, List, Optional
-
+from collections import OrderedDict
+from typing import Any
+
+from pydantic import TypeAdapter
+
+from app.application._router_fast import (
+    AUDIO_EXTENSIONS,
+    AUDIO_FILE_TYPES,
+    conversation_meta,
+    derive_recipient_id,
+    dig,
+    first_audio_attachment,
+    resolve_attachment_url,
+)
+from app.application.outbound_batch import OutboundBatcher
 from app.domain.message import MediaContent, TextContent
 from app.domain.ports import MessengerAdapter
-from app.domain.webhooks.chatwoot import ChatwootMessageCreatedWebhook
+from app.domain.webhooks.chatwoot import ChatwootMessageGate
 
 logger = logging.getLogger(__name__)
 
-# Extensões de áudio aceites para enviar como voice/audio no Telegram
-AUDIO_EXTENSIONS = {"ogg", "oga", "m4a", "mp3", "opus", "wav"}
-AUDIO_FILE_TYPES = {"audio", "voice"}
+# Onde o Chatwoot pode colocar os anexos no webhook, por ordem de preferência
+_ATTACHMENT_PATHS = (
+    ("attachments",),
+    ("content_attributes", "attachments"),
+    ("message", "attachments"),
+)
+
+# Cache de recipient_id por (conversation.id, canal); chave extra: sender.updated_at
+RECIPIENT_CACHE_MAX = 1024
 
+# Validador montado uma vez no import (só os campos usados nos gates de handle_outgoing)
+_GATE_ADAPTER = TypeAdapter(ChatwootMessageGate)
 
-def _dig(src: dict, *path, default=None):
-    """Safe dict traversal: _dig(d, 'a','b','c') -> d['a']['b']['c'] or default."""
-    cur: Any = src
-    for key in path:
-        if not isinstance(cur, dict) or key not in cur:
-            return default
-        cur = cur[key]
-    return cur
+
+def _text_content(text: str) -> TextContent:
+    """TextContent sem revalidar (text já é str aqui; evita o custo do pydantic por envio)."""
+    return TextContent.model_construct(type="text", text=text)
 
 
 class MessageRouter:
     """Router: dispatch outgoing text messages to channel adapters."""
 
+    __slots__ = (
+        "adapters",
+        "_concurrency",
+        "_sems",
+        "_batchers",
+        "_rid_cache",
+        "_chatwoot_base",
+        "_bus",
+    )
+
     def __init__(
         self,
-        adapters: Dict[str, MessengerAdapter] | None = None,
+        adapters: dict[str, MessengerAdapter] | None = None,
         chatwoot_base_url: str | None = None,
         bus: Any = None,
+        concurrency: int = 8,
     ):
         self.adapters = adapters or {}
+        # Limite de envios simultâneos por canal (evita sobrecarregar Telethon/APIs em bursts)
+        self._concurrency = concurrency
+        self._sems: dict[str, asyncio.Semaphore] = {}
+        # Agregadores de envio por canal (só para adapters com envio em lote, ex.: VK)
+        self._batchers: dict[str, OutboundBatcher | None] = {}
+        # (conv_id, channel) -> (sender_id, sender_updated_at, recipient_id), ordem LRU
+        self._rid_cache: OrderedDict[tuple[int, str], tuple[Any, Any, str]] = OrderedDict()
         # Para resolver URLs relativas dos anexos (ex.: /rails/active_storage/...)
-        self._chatwoot_base = (chatwoot_base_url or "").rstrip("/")
+        # (HttpUrl vira str com "/" final; normalizado uma vez aqui, não a cada anexo)
+        self._chatwoot_base = str(chatwoot_base_url or "").strip().rstrip("/")
         self._bus = bus
 
+    def _channel_sem(self, channel: str) -> asyncio.Semaphore:
+        sem = self._sems.get(channel)
+        if sem is None:
+            sem = self._sems[channel] = asyncio.Semaphore(self._concurrency)
+        return sem
+
+    def _channel_batcher(
+        self, channel: str, adapter: MessengerAdapter
+    ) -> OutboundBatcher | None:
+        if channel in self._batchers:
+            return self._batchers[channel]
+        batcher = None
+        send_many = getattr(adapter, "send_text_many", None)
+        if callable(send_many):
+            sem = self._channel_sem(channel)
+
+            async def _send_one(recipient_id: str, text: str) -> None:
+                async with sem:
+                    await adapter.send_text(recipient_id, _text_content(text))
+
+            async def _send_many(recipient_ids: list[str], text: str) -> dict[str, str]:
+                async with sem:
+                    return await send_many(recipient_ids, _text_content(text))
+
+            batcher = OutboundBatcher(_send_one, _send_many)
+        self._batchers[channel] = batcher
+        return batcher
+
     async def handle_incoming(self, msg):
         # Not implemented in this demo
-        logger.info(
-            "[router] INCOMING: channel=%s recipient_id=%s sender_name=%s content=%s",
-            getattr(msg, "channel", None),
-            getattr(msg, "recipient_id", None),
-            getattr(msg, "sender_name", None),
-            getattr(msg, "content", None),
-        )
+        if logger.isEnabledFor(logging.INFO):
+            logger.info(
+                "[router] INCOMING: channel=%s recipient_id=%s sender_name=%s content=%s",
+                getattr(msg, "channel", None),
+                getattr(msg, "recipient_id", None),
+                getattr(msg, "sender_name", None),
+                getattr(msg, "content", None),
+            )
 
     def _derive_recipient_id(self, channel: str | None, payload: dict) -> str | None:
         """
-        Build recipient_id per channel. We never read it from Chatwoot.
+        Build recipient_id per channel (rules in _router_fast). We never read it from Chatwoot.
         whatsapp:
           - conversation.meta.sender.phone_number
         telegram:
@@ -62,126 +127,99 @@ class MessageRouter:
           1) sender.custom_attributes.vk_peer_id                         -> '<int>'
           2) sender.custom_attributes.vk_user_id                         -> '<int>'
         """
-        if not channel:
-            return None
-
-        sender = _dig(payload, "conversation", "meta", "sender", default={}) or {}
-
-        if channel == "whatsapp":
-            phone = (sender.get("phone_number") or "").strip()
-            return phone or None
-
-        if channel == "telegram":
-            # 1) username from custom attributes
-            username = (sender.get("custom_attributes", {}) or {}).get(
-                "telegram_username", ""
-            )
-            username = (username or "").strip()
-            if username:
-                return username
-
-            # 2) username from additional attributes (added by Chatwoot TG bot)
-            social_username = (sender.get("additional_attributes", {}) or {}).get(
-                "social_telegram_user_name", ""
-            )
-            social_username = (social_username or "").strip()
-            if social_username:
-                return social_username
-
-            # 3) phone number
-            phone = (sender.get("phone_number") or "").strip()
-            if phone:
-                return phone
-
-            # 4) numeric user id from custom attributes
-            tg_uid = (sender.get("custom_attributes", {}) or {}).get("telegram_user_id")
-            if tg_uid is not None and str(tg_uid).strip():
-                return f"id:{tg_uid}"
-
-            # 5) numeric user id from additional attributes (added by Chatwoot TG bot)
-            social_tg_uid = (sender.get("additional_attributes", {}) or {}).get(
-                "social_telegram_user_id"
-            )
-            if social_tg_uid is not None and str(social_tg_uid).strip():
-                return f"id:{social_tg_uid}"
-
-            return None
+        return derive_recipient_id(channel, payload)
 
-        if channel == "vk":
-            # 1) peer_id from custom attributes
-            vk_peer_id = (sender.get("custom_attributes", {}) or {}).get("vk_peer_id")
-            if vk_peer_id is not None and str(vk_peer_id).strip():
-                return str(vk_peer_id).strip()
-
-            # 2) user_id from custom attributes
-            vk_user_id = (sender.get("custom_attributes", {}) or {}).get("vk_user_id")
-            if vk_user_id is not None and str(vk_user_id).strip():
-                return str(vk_user_id).strip()
-
-            return None
+    def _cached_recipient_id(self, channel: str | None, payload: dict) -> str | None:
+        """
+        _derive_recipient_id memoized per conversation: Chatwoot sends several webhooks for
+        the same conversation in a row. Only used when sender.updated_at is present, so a
+        changed contact (new attributes) gets a new key; contact_updated also invalidates.
+        """
+        conv_id = dig(payload, "conversation", "id")
+        sender = conversation_meta(payload).get("sender")
+        updated_at = sender.get("updated_at") if isinstance(sender, dict) else None
+        if not channel or conv_id is None or updated_at is None:
+            return self._derive_recipient_id(channel=channel, payload=payload)
+
+        key = (conv_id, channel)
+        cached = self._rid_cache.get(key)
+        if cached is not None and cached[1] == updated_at:
+            self._rid_cache.move_to_end(key)
+            return cached[2]
 
-        # Other channels: do not guess
-        return None
+        recipient_id = self._derive_recipient_id(channel=channel, payload=payload)
+        if recipient_id:
+            self._rid_cache[key] = (sender.get("id"), updated_at, recipient_id)
+            self._rid_cache.move_to_end(key)
+            if len(self._rid_cache) > RECIPIENT_CACHE_MAX:
+                self._rid_cache.popitem(last=False)
+        else:
+            self._rid_cache.pop(key, None)
+        return recipient_id
+
+    def invalidate_contact(self, contact_id: Any) -> None:
+        """Drop cached recipient_ids of a contact (Chatwoot contact_updated webhook)."""
+        stale = [key for key, entry in self._rid_cache.items() if entry[0] == contact_id]
+        for key in stale:
+            del self._rid_cache[key]
 
     def _resolve_attachment_url(self, data_url: str) -> str:
         """Converte URL relativa do Chatwoot em absoluta (necessário para download)."""
-        url = (data_url or "").strip()
-        if url.startswith("/") and self._chatwoot_base:
-            return f"{self._chatwoot_base}{url}"
-        return url
+        return resolve_attachment_url(self._chatwoot_base, data_url)
 
     def _first_audio_attachment(
-        self, attachments: List[Dict[str, Any]], transcript: str = ""
+        self, attachments: list[dict[str, Any]], transcript: str = ""
     ) -> MediaContent | None:
         """Extrai o primeiro anexo de áudio (data_url) para enviar ao Telegram."""
-        for att in attachments:
-            if not isinstance(att, dict):
-                continue
-            file_type = (att.get("file_type") or "").lower()
-            ext = (att.get("extension") or "").lstrip(".").lower()
-            data_url = (att.get("data_url") or att.get("file_url") or "").strip()
-            if not data_url:
-                continue
-            if file_type in AUDIO_FILE_TYPES or ext in AUDIO_EXTENSIONS:
-                url = self._resolve_attachment_url(data_url)
-                return MediaContent(
-                    type="media",
-                    media_type="audio",
-                    url=url,
-                    caption=None,
-                    filename=att.get("filename"),
-                    mime_type=att.get("content_type"),
-                    transcript=(transcript or None),
-                )
-        return None
+        return first_audio_attachment(attachments, self._chatwoot_base, transcript)
 
     async def handle_outgoing(self, payload: dict) -> None:
         """
         Process Chatwoot outgoing webhook and dispatch text to a proper adapter.
         Note: we trust channel injected at HTTP layer: payload['conversation']['meta']['channel'].
         """
-        try:
-            cw = ChatwootMessageCreatedWebhook.model_validate(payload)
-        except Exception as e:
-            logger.warning("[router] Invalid Chatwoot payload: %s", e)
-            return
+        # Gates direto no dict (caso comum: tipos JSON já corretos); pydantic só valida/coage
+        # quando algum campo vem com tipo inesperado ou falta event
+        raw = payload if isinstance(payload, dict) else {}
+        event, private = raw.get("event"), raw.get("private")
+        message_type, content = raw.get("message_type"), raw.get("content")
+        if not (
+            isinstance(event, str)
+            and (private is None or isinstance(private, bool))
+            and (message_type is None or isinstance(message_type, str))
+            and (content is None or isinstance(content, str))
+        ):
+            try:
+                cw = _GATE_ADAPTER.validate_python(payload)
+            except Exception as e:
+                logger.warning("[router] Invalid Chatwoot payload: %s", e)
+                return
+            event, private, message_type, content = (
+                cw.event,
+                cw.private,
+                cw.message_type,
+                cw.content,
+            )
 
-        if cw.event != "message_created":
-            logger.info("[router] Ignored Chatwoot event: %s", cw.event)
+        if event != "message_created":
+            if logger.isEnabledFor(logging.INFO):
+                logger.info("[router] Ignored Chatwoot event: %s", event)
             return
-        if cw.private:
-            logger.info("[router] Ignored private message")
+        if private:
+            if logger.isEnabledFor(logging.INFO):
+                logger.info("[router] Ignored private message")
             return
-        if cw.message_type != "outgoing":
-            logger.info("[router] Ignored message_type: %s", cw.message_type)
+        if message_type != "outgoing":
+            if logger.isEnabledFor(logging.INFO):
+                logger.info("[router] Ignored message_type: %s", message_type)
             return
 
         # Channel comes from raw payload (HTTP layer injected it into meta)
-        channel = _dig(payload, "conversation", "meta", "channel")
-        text = (cw.content or "").strip()
+        channel = conversation_meta(payload).get("channel")
+        text = (content or "").strip()
 
         # Always derive recipient_id (Chatwoot never provides it)
-        recipient_id = self._derive_recipient_id(channel=channel, payload=payload)
+        recipient_id = self._cached_recipient_id(channel, payload)
 
         if not channel or not recipient_id:
             logger.warning(
@@ -192,11 +230,11 @@ class MessageRouter:
             return
 
         # Anexos: payload pode ter "attachments" no topo, em content_attributes ou em message
-        attachments: List[Dict[str, Any]] = payload.get("attachments") or []
-        if not attachments and isinstance(_dig(payload, "content_attributes"), dict):
-            attachments = _dig(payload, "content_attributes", "attachments") or []
-        if not attachments:
-            attachments = _dig(payload, "message", "attachments") or []
+        attachments: list[dict[str, Any]] = []
+        for path in _ATTACHMENT_PATHS:
+            attachments = dig(payload, *path) or []
+            if attachments:
+                break
 
         # Texto não é obrigatório: pode enviar só áudio (ou outro anexo). Exige texto OU anexo.
         if not text and not attachments:
@@ -209,33 +247,45 @@ class MessageRouter:
             )
             return
 
-        if text:
-            await self.dispatch_outbound(
-                channel=channel, recipient_id=recipient_id, text=text
-            )
-
         # Primeiro anexo de áudio: enviar como media (voice no Telegram), com ou sem texto
+        first_audio: MediaContent | None = None
         if attachments and channel == "telegram":
             first_audio = self._first_audio_attachment(attachments, transcript=text)
-            if first_audio:
-                await self.dispatch_outbound_media(
-                    channel=channel,
-                    recipient_id=recipient_id,
-                    media=first_audio,
-                )
-            elif not text:
+            if not first_audio and not text:
                 logger.warning(
                     "[router] No text and no audio attachment found: attachments=%s",
                     [a.get("file_type") for a in attachments],
                 )
 
+        # Texto e áudio são independentes: enviar em paralelo
+        sends = []
+        if text:
+            sends.append(
+                self.dispatch_outbound(channel=channel, recipient_id=recipient_id, text=text)
+            )
+        if first_audio:
+            sends.append(
+                self.dispatch_outbound_media(
+                    channel=channel,
+                    recipient_id=recipient_id,
+                    media=first_audio,
+                )
+            )
+        if sends:
+            results = await asyncio.gather(*sends, return_exceptions=True)
+            for res in results:
+                if isinstance(res, Exception):
+                    logger.error(
+                        "[router] OUTBOUND MEDIA send failed: %s", res, exc_info=res
+                    )
+
     async def dispatch_direct(
         self,
         channel: str,
         recipient_id: str,
         text: str,
         typing_seconds: float = 2.0,
-        access_hash: Optional[int] = None,
+        access_hash: int | None = None,
         emit_outgoing_event: bool = True,
     ) -> None:
         """
@@ -253,32 +303,35 @@ class MessageRouter:
         if typing_seconds > 0:
             set_typing = getattr(adapter, "set_typing", None)
             if callable(set_typing):
-                try:
-                    await set_typing(
-                        recipient_id, typing=True, access_hash=access_hash
-                    )
-                    await asyncio.sleep(typing_seconds)
-                except Exception as e:
-                    logger.warning("[router] set_typing falhou (ignorado): %s", e)
+                # set_typing corre em paralelo com a espera (latência = max, não a soma)
+                typing_result, _ = await asyncio.gather(
+                    set_typing(recipient_id, typing=True, access_hash=access_hash),
+                    asyncio.sleep(typing_seconds),
+                    return_exceptions=True,
+                )
+                if isinstance(typing_result, Exception):
+                    logger.warning("[router] set_typing falhou (ignorado): %s", typing_result)
 
         try:
             # mark_as_gateway_send=False para o handler telegram.outgoing criar a msg no Chatwoot
-            await adapter.send_text(
-                recipient_id,
-                TextContent(type="text", text=text),
-                access_hash=access_hash,
-                mark_as_gateway_send=False,
-            )
+            async with self._channel_sem(channel):
+                await adapter.send_text(
+                    recipient_id,
+                    _text_content(text),
+                    access_hash=access_hash,
+                    mark_as_gateway_send=False,
+                )
         except (ValueError, RuntimeError):
             raise
         except Exception as e:
             logger.exception("[router] DISPATCH send_text failed: %s", e)
             raise RuntimeError(f"Falha ao enviar: {e}") from e
-        logger.info(
-            "[router] DISPATCH: recipient_id=%s text=%r",
-            recipient_id,
-            text[:80] + "..." if len(text) > 80 else text,
-        )
+        if logger.isEnabledFor(logging.INFO):
+            logger.info(
+                "[router] DISPATCH: recipient_id=%s text=%r",
+                recipient_id,
+                text[:80] + "..." if len(text) > 80 else text,
+            )
         # Garantir que a mensagem aparece no Chatwoot: emitir para o handler criar
         # (o evento Telethon pode chegar depois; o handler ignora duplicados por conv_id+text)
         # Se emit_outgoing_event=False, a mensagem já foi criada no Chatwoot pelo chamador (ex.: /dispatch).
@@ -300,17 +353,23 @@ class MessageRouter:
             logger.warning("[router] No adapter for channel=%s", channel)
             return
 
+        batcher = self._channel_batcher(channel, adapter)
         try:
-            await adapter.send_text(recipient_id, TextContent(type="text", text=text))
+            if batcher is not None:
+                await batcher.send(recipient_id, text)
+            else:
+                async with self._channel_sem(channel):
+                    await adapter.send_text(recipient_id, _text_content(text))
         except Exception as e:
             logger.exception("[router] OUTBOUND send_text failed: %s", e)
             return
-        logger.info(
-            "[router] OUTBOUND: channel=%s recipient_id=%s text=%r",
-            channel,
-            recipient_id,
-            text,
-        )
+        if logger.isEnabledFor(logging.INFO):
+            logger.info(
+                "[router] OUTBOUND: channel=%s recipient_id=%s text=%r",
+                channel,
+                recipient_id,
+                text[:80] + "..." if len(text) > 80 else text,
+            )
 
     async def dispatch_outbound_media(
         self, channel: str, recipient_id: str, media: MediaContent
@@ -321,10 +380,12 @@ class MessageRouter:
             logger.warning("[router] No adapter for channel=%s", channel)
             return
 
-        await adapter.send_media(recipient_id, media)
-        logger.info(
-            "[router] OUTBOUND MEDIA: channel=%s recipient_id=%s media_type=%s",
-            channel,
-            recipient_id,
-            media.media_type,
-        )
+        async with self._channel_sem(channel):
+            await adapter.send_media(recipient_id, media)
+        if logger.isEnabledFor(logging.INFO):
+            logger.info(
+                "[router] OUTBOUND MEDIA: channel=%s recipient_id=%s media_type=%s",
+                channel,
+                recipient_id,
+                media.media_type,
+            )
@@ -1,5 +1,5 @@
 import os
-from typing import Dict, Optional
+from collections.abc import Mapping
 
 from pydantic import BaseModel, Field, HttpUrl, ValidationError
 
@@ -34,34 +34,40 @@ class ChatwootWebhookConfig(BaseModel):
     account_id: int
     base_url: HttpUrl
     # Map webhook id -> channel name
-    channel_by_webhook_id: Dict[str, str] = Field(default_factory=dict)
+    channel_by_webhook_id: dict[str, str] = Field(default_factory=dict)
     # Map channel name -> inbox_id (para filtrar webhooks por caixa de entrada)
-    inbox_id_by_channel: Dict[str, int] = Field(default_factory=dict)
+    inbox_id_by_channel: dict[str, int] = Field(default_factory=dict)
 
 
 class AppConfig(BaseModel):
-    telegram: Optional[TelegramConfig] = None
-    wasender: Optional[WasenderWebhookConfig] = None
-    vk: Optional[VKCommunityConfig] = None
+    telegram: TelegramConfig | None = None
+    wasender: WasenderWebhookConfig | None = None
+    vk: VKCommunityConfig | None = None
     chatwoot: ChatwootWebhookConfig
     # Token para o endpoint de disparo manual (DISPATCH_API_TOKEN). Se vazio, o endpoint fica desativado.
-    dispatch_api_token: Optional[str] = None
+    dispatch_api_token: str | None = None
+    # Envios simultâneos por canal no MessageRouter (ROUTER_CONCURRENCY)
+    router_concurrency: int = Field(default=8, ge=1)
+    # Tamanho máximo do corpo de um webhook em bytes (MAX_WEBHOOK_BODY_BYTES); acima disso → 413
+    max_webhook_body_bytes: int = Field(default=1024 * 1024, ge=1)
+    # Threads do executor por omissão (BLOCKING_IO_WORKERS): leitura/escrita de anexos, mutagen
+    blocking_io_workers: int = Field(default=8, ge=1)
 
 
-def _getenv(name: str) -> str:
+def _getenv(env: Mapping[str, str], name: str) -> str:
     """Get required environment variable or raise RuntimeError."""
-    v = os.getenv(name)
+    v = env.get(name)
     if not v:
         raise RuntimeError(f"Missing required environment variable: {name}")
     return v
 
 
-def _build_channel_map() -> Dict[str, str]:
+def _build_channel_map(env: Mapping[str, str]) -> dict[str, str]:
     """Build a map from webhook ID to channel name."""
-    mapping: Dict[str, str] = {}
-    w = os.getenv("CHATWOOT_WEBHOOK_ID_WHATSAPP")
-    t = os.getenv("CHATWOOT_WEBHOOK_ID_TELEGRAM")
-    v = os.getenv("CHATWOOT_WEBHOOK_ID_VK")
+    mapping: dict[str, str] = {}
+    w = env.get("CHATWOOT_WEBHOOK_ID_WHATSAPP")
+    t = env.get("CHATWOOT_WEBHOOK_ID_TELEGRAM")
+    v = env.get("CHATWOOT_WEBHOOK_ID_VK")
     if w:
         mapping[w] = "whatsapp"
     if t:
@@ -72,57 +78,59 @@ def _build_channel_map() -> Dict[str, str]:
 
 
 def load_config() -> AppConfig:
+    # Snapshot do ambiente: dict simples em vez de várias leituras de os.environ
+    env = dict(os.environ)
     try:
         # Telegram config: TG_API_ID + TG_API_HASH + TG_INBOX_ID; TG_SESSION_NAME opcional (default: session → session.session)
-        if os.getenv("TG_API_ID") and os.getenv("TG_API_HASH") and os.getenv("TG_INBOX_ID"):
+        if env.get("TG_API_ID") and env.get("TG_API_HASH") and env.get("TG_INBOX_ID"):
             telegram_cfg = TelegramConfig(
-                api_id=int(_getenv("TG_API_ID")),
-                api_hash=_getenv("TG_API_HASH"),
-                session_name=os.getenv("TG_SESSION_NAME", "").strip() or "session",
-                inbox_id=int(_getenv("TG_INBOX_ID")),
+                api_id=int(_getenv(env, "TG_API_ID")),
+                api_hash=_getenv(env, "TG_API_HASH"),
+                session_name=env.get("TG_SESSION_NAME", "").strip() or "session",
+                inbox_id=int(_getenv(env, "TG_INBOX_ID")),
             )
         else:
             telegram_cfg = None
 
         # Wasender config: only if all variables are present
         if (
-            os.getenv("WASENDER_WEBHOOK_ID")
-            and os.getenv("WASENDER_WEBHOOK_SECRET")
-            and os.getenv("WASENDER_API_KEY")
+            env.get("WASENDER_WEBHOOK_ID")
+            and env.get("WASENDER_WEBHOOK_SECRET")
+            and env.get("WASENDER_API_KEY")
         ):
             wasender_cfg = WasenderWebhookConfig(
-                webhook_id=_getenv("WASENDER_WEBHOOK_ID"),
-                webhook_secret=_getenv("WASENDER_WEBHOOK_SECRET"),
-                api_key=_getenv("WASENDER_API_KEY"),
-                inbox_id=int(os.getenv("WASENDER_INBOX_ID")),
+                webhook_id=_getenv(env, "WASENDER_WEBHOOK_ID"),
+                webhook_secret=_getenv(env, "WASENDER_WEBHOOK_SECRET"),
+                api_key=_getenv(env, "WASENDER_API_KEY"),
+                inbox_id=int(env.get("WASENDER_INBOX_ID")),
             )
         else:
             wasender_cfg = None
 
         # VK: create config only if all required variables are present
         if (
-            os.getenv("VK_CALLBACK_ID")
-            and os.getenv("VK_GROUP_ID")
-            and os.getenv("VK_ACCESS_TOKEN")
-            and os.getenv("VK_SECRET")
-            and os.getenv("VK_CONFIRMATION")
+            env.get("VK_CALLBACK_ID")
+            and env.get("VK_GROUP_ID")
+            and env.get("VK_ACCESS_TOKEN")
+            and env.get("VK_SECRET")
+            and env.get("VK_CONFIRMATION")
         ):
             vk_cfg = VKCommunityConfig(
-                callback_id=_getenv("VK_CALLBACK_ID"),
-                group_id=int(_getenv("VK_GROUP_ID")),
-                access_token=_getenv("VK_ACCESS_TOKEN"),
-                secret=_getenv("VK_SECRET"),
-                confirmation=_getenv("VK_CONFIRMATION"),
-                api_version=os.getenv("VK_API_VERSION") or "5.199",
-                inbox_id=int(os.getenv("VK_INBOX_ID")),
+                callback_id=_getenv(env, "VK_CALLBACK_ID"),
+                group_id=int(_getenv(env, "VK_GROUP_ID")),
+                access_token=_getenv(env, "VK_ACCESS_TOKEN"),
+                secret=_getenv(env, "VK_SECRET"),
+                confirmation=_getenv(env, "VK_CONFIRMATION"),
+                api_version=env.get("VK_API_VERSION") or "5.199",
+                inbox_id=int(env.get("VK_INBOX_ID")),
             )
         else:
             vk_cfg = None
 
-        dispatch_token = (os.getenv("DISPATCH_API_TOKEN") or "").strip() or None
+        dispatch_token = (env.get("DISPATCH_API_TOKEN") or "").strip() or None
 
         # Mapa canal -> inbox_id para filtrar webhooks por caixa (evitar conflito entre caixas)
-        inbox_by_channel: Dict[str, int] = {}
+        inbox_by_channel: dict[str, int] = {}
         if telegram_cfg:
             inbox_by_channel["telegram"] = telegram_cfg.inbox_id
         if wasender_cfg:
@@ -135,13 +143,18 @@ def load_config() -> AppConfig:
             wasender=wasender_cfg,
             vk=vk_cfg,
             chatwoot=ChatwootWebhookConfig(
-                api_access_token=_getenv("CHATWOOT_API_ACCESS_TOKEN"),
-                account_id=int(_getenv("CHATWOOT_ACCOUNT_ID")),
-                base_url=_getenv("CHATWOOT_BASE_URL"),
-                channel_by_webhook_id=_build_channel_map(),
+                api_access_token=_getenv(env, "CHATWOOT_API_ACCESS_TOKEN"),
+                account_id=int(_getenv(env, "CHATWOOT_ACCOUNT_ID")),
+                base_url=_getenv(env, "CHATWOOT_BASE_URL"),
+                channel_by_webhook_id=_build_channel_map(env),
                 inbox_id_by_channel=inbox_by_channel,
             ),
             dispatch_api_token=dispatch_token,
+            router_concurrency=int(env.get("ROUTER_CONCURRENCY") or 8),
+            max_webhook_body_bytes=int(env.get("MAX_WEBHOOK_BODY_BYTES") or 1024 * 1024),
+            blocking_io_workers=int(
+                env.get("BLOCKING_IO_WORKERS") or min(8, (os.cpu_count() or 2) * 2)
+            ),
         )
     except ValidationError as e:
         raise RuntimeError(f"Invalid configuration: {e}") from e
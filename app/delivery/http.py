@@ -1,25 +1,127 @@
+import hashlib
+import hmac
 import logging
-from typing import Any, Dict, Optional
+import sys
+from typing import Annotated, Any, Dict, List, Optional, Tuple
 
+import orjson
 from fastapi import APIRouter, Header, HTTPException, Request
-from pydantic import BaseModel, Field, field_validator
-from pyee.asyncio import AsyncIOEventEmitter
-from starlette.responses import PlainTextResponse
+from fastapi.responses import ORJSONResponse
+from pydantic import BaseModel, BeforeValidator, Field
+from starlette.responses import PlainTextResponse, Response
 
 from app.application.chatwoot_service import ChatwootService
-from app.application.events import register_dispatch_created_outgoing
+from app.application.events import event_queue_full, register_dispatch_created_outgoing
 from app.application.router import MessageRouter
 from app.config import AppConfig
-from app.domain.webhooks.wasender import WasenderWebhookPayload
+from app.infra.bus import EventBus
 from app.infra.chatwoot_client import ChatwootClient
 
 logger = logging.getLogger(__name__)
 
+# Respostas constantes dos webhooks serializadas uma vez no import
+_OK_BODY = orjson.dumps({"status": "ok"})
+_RECEIVED_BODY = orjson.dumps({"status": "received"})
+_BEARER = b"Bearer "
+_VK_OK_BODY = b"ok"
+
+# Webhook Chatwoot (event, message_type) -> tópico do bus; None = qualquer message_type
+_CHATWOOT_TOPICS: Dict[Tuple[str, Optional[str]], str] = {
+    ("message_created", "incoming"): "chatwoot.incoming",
+    ("message_created", "outgoing"): "chatwoot.outgoing",
+    ("conversation_status_changed", None): "chatwoot.conversation_status_changed",
+    ("contact_updated", None): "chatwoot.contact_updated",
+}
+
+
+def _json_ack(body: bytes) -> Response:
+    return Response(content=body, media_type="application/json")
+
+
+def _text_ack(body: bytes) -> PlainTextResponse:
+    return PlainTextResponse(content=body)
+
+
+def _submit(bus: EventBus, event: str, payload: Dict[str, Any]) -> None:
+    """Emit a webhook event; 503 (provider retries later) if its channel queue is full."""
+    if event_queue_full(event):
+        logger.warning("[http] %s queue full, rejecting webhook", event)
+        raise HTTPException(status_code=503, detail="Event queue is full, retry later")
+    bus.emit(event, payload)
+
+
+# Clientes Chatwoot dos endpoints de disparo (ligação persistente; fechados em close_http)
+_chatwoot_clients: List[ChatwootClient] = []
+
+
+async def close_http() -> None:
+    """Close the dispatch Chatwoot client (call on shutdown)."""
+    for client in _chatwoot_clients:
+        await client.aclose()
+    _chatwoot_clients.clear()
+
+
+def _safe_eq(value: Any, expected: str) -> bool:
+    """Constant-time comparison of a received secret/token/id with the configured one."""
+    if not isinstance(value, str):
+        return False
+    return hmac.compare_digest(value.encode("utf-8"), expected.encode("utf-8"))
+
+
+def _valid_wasender_signature(signature: Any, secret: str, body: bytes | bytearray) -> bool:
+    """
+    X-Webhook-Signature check, constant-time: HMAC-SHA256 hex of the raw body keyed with the
+    webhook secret, or the secret itself (what Wasender sends today, kept for compatibility).
+    """
+    if not isinstance(signature, str):
+        return False
+    mac = hmac.new(secret.encode("utf-8"), body, hashlib.sha256).hexdigest()
+    # Avaliar as duas comparações sempre (sem curto-circuito)
+    hmac_ok = _safe_eq(signature.lower(), mac)
+    plain_ok = _safe_eq(signature, secret)
+    return hmac_ok or plain_ok
+
+
+def _channel_for_webhook(channel_by_webhook_id: Dict[str, str], webhook_id: str) -> Optional[str]:
+    """Webhook id -> channel, comparing every configured id in constant time (no dict lookup)."""
+    channel = None
+    for known_id, name in channel_by_webhook_id.items():
+        if _safe_eq(webhook_id, known_id):
+            channel = name
+    return channel
+
+
+def _recipient_to_str(v: object) -> str:
+    """Aceita número (ex.: n8n envia 6149474306) e converte para string."""
+    return "" if v is None else str(v).strip()
+
+
+def _access_hash_before(v: object) -> object:
+    """
+    Caminhos comuns resolvidos por tipo: None/int passam, string numérica (pode ser negativa:
+    access_hash é int64 com sinal) vira int, string vazia (campo não preenchido no n8n) é ausente.
+    O resto tenta int(); valor não convertível vira None (resolve pela entidade, como antes).
+    """
+    if v is None or isinstance(v, int):
+        return v
+    if isinstance(v, str):
+        s = v.strip()
+        if not s:
+            return None
+        if s.isdigit() or (s[0] == "-" and s[1:].isdigit()):
+            return int(s)
+    try:
+        return int(v)  # type: ignore[call-overload]
+    except (TypeError, ValueError):
+        return None
+
 
 class DispatchBody(BaseModel):
     """Corpo do endpoint de disparo manual (apenas Telegram): destinatário, texto e tempo de typing."""
 
-    recipient_id: str = Field(..., min_length=1, description="ID do destinatário (ex: @user, 6149474306)")
+    recipient_id: Annotated[str, BeforeValidator(_recipient_to_str)] = Field(
+        ..., min_length=1, description="ID do destinatário (ex: @user, 6149474306)"
+    )
     text: str = Field(..., min_length=1, description="Texto da mensagem")
     typing_seconds: float = Field(
         default=2.0,
@@ -27,174 +129,239 @@ class DispatchBody(BaseModel):
         le=60,
         description="Segundos que o indicador de digitação fica ativo antes de enviar (0 = sem typing)",
     )
-    access_hash: Optional[int] = Field(
+    # Número ou string numérica -> int; qualquer outro valor -> None (sem 422)
+    access_hash: Annotated[Optional[int], BeforeValidator(_access_hash_before)] = Field(
         default=None,
         description="Access hash do destinatário (Telegram). Obrigatório para enviar para pessoas novas (que não iniciaram conversa); sem ele o envio por user_id falha.",
     )
 
-    @field_validator("recipient_id", mode="before")
-    @classmethod
-    def recipient_id_to_str(cls, v: object) -> str:
-        """Aceita número (ex.: n8n envia 6149474306) e converte para string."""
-        if v is None:
-            return ""
-        return str(v).strip()
-
-    @field_validator("access_hash", mode="before")
-    @classmethod
-    def access_hash_to_int(cls, v: object) -> Optional[int]:
-        """Aceita número ou string numérica (ex.: do n8n) e converte para int."""
-        if v is None:
-            return None
-        try:
-            return int(v)
-        except (TypeError, ValueError):
-            return None
+
+async def _read_body(request: Request, limit: int) -> bytes | bytearray:
+    """
+    Read the request body into a buffer pre-allocated from Content-Length (no repeated
+    growth on large webhooks). Bodies over limit are rejected with 413: from the header
+    alone when it is present, otherwise while streaming.
+    """
+    try:
+        size = int(request.headers.get("content-length") or "")
+    except ValueError:
+        size = -1
+    if size > limit:
+        raise HTTPException(status_code=413, detail="Payload too large")
+    if size < 0:
+        body = bytearray()
+        async for chunk in request.stream():
+            body += chunk
+            if len(body) > limit:
+                raise HTTPException(status_code=413, detail="Payload too large")
+        return body
+
+    buf = bytearray(size)
+    view = memoryview(buf)
+    off = 0
+    async for chunk in request.stream():
+        end = off + len(chunk)
+        if end > size:
+            raise HTTPException(status_code=400, detail="Body larger than Content-Length")
+        view[off:end] = chunk
+        off = end
+    view.release()
+    return buf if off == size else buf[:off]
+
+
+def _decode_json(body: bytes | bytearray) -> Dict[str, Any]:
+    """Decode a webhook body with orjson; anything but a JSON object is a 400."""
+    try:
+        payload = orjson.loads(body)
+    except orjson.JSONDecodeError:
+        raise HTTPException(status_code=400, detail="Invalid JSON body")
+    if not isinstance(payload, dict):
+        raise HTTPException(status_code=400, detail="Invalid JSON body")
+    return payload
 
 
 def create_router(
-    bus: AsyncIOEventEmitter,
+    bus: EventBus,
     config: AppConfig,
     message_router: Optional[MessageRouter] = None,
 ) -> APIRouter:
     """
     Build HTTP routes with simple security checks.
+    All handlers are async def and do no blocking I/O in the request path (config lookups are
+    plain dicts built in load_config; bus.emit only enqueues onto the channel worker queues).
     """
-    router = APIRouter(tags=["webhooks"])
+    router = APIRouter(tags=["webhooks"], default_response_class=ORJSONResponse)
+    body_limit = config.max_webhook_body_bytes
+    # Respostas do VK codificadas uma vez (o objeto Response em si não é reutilizado:
+    # o FastAPI associa-lhe as background tasks do pedido)
+    vk_confirmation_body = config.vk.confirmation.encode("utf-8") if config.vk else b""
+    # inbox_id esperado por canal já como str: o filtro do webhook compara sem int() por pedido
+    inbox_str_by_channel = {
+        ch: str(inbox) for ch, inbox in config.chatwoot.inbox_id_by_channel.items()
+    }
+
+    # /health: tudo vem da config (fixo após o arranque) exceto o status do Telegram,
+    # por isso o corpo é montado e serializado uma vez aqui
+    wasender_enabled = bool(getattr(config, "wasender", None))
+    telegram_enabled = bool(getattr(config, "telegram", None))
+    vk_enabled = bool(getattr(config, "vk", None))
+    health_body: Dict[str, Any] = {
+        "ok": True,
+        "chatwoot": {
+            "account_id": config.chatwoot.account_id,
+            "base_url": str(config.chatwoot.base_url),
+            "channels_configured": list(config.chatwoot.channel_by_webhook_id.values()),
+        },
+        "wasender": {
+            "enabled": wasender_enabled,
+        },
+        "telegram": {
+            "enabled": telegram_enabled,
+            "session_name": (config.telegram.session_name if telegram_enabled else None),
+            "status": None,
+        },
+        "vk": {
+            "enabled": vk_enabled,
+            # Do not expose callback_id/secret/token; group_id is safe to show
+            "group_id": config.vk.group_id if vk_enabled else None,
+        },
+    }
+    health_bytes = orjson.dumps(health_body)
 
     @router.get("/health")
     async def health():
         # Report only non-sensitive fields
-        wasender_enabled = bool(getattr(config, "wasender", None))
-        telegram_enabled = bool(getattr(config, "telegram", None))
-        vk_enabled = bool(getattr(config, "vk", None))
-
-        # Obter status do Telegram (se configurado)
-        telegram_status = None
+        # Obter status do Telegram (se configurado); sem ele, o corpo pré-serializado serve
+        get_status = None
         if telegram_enabled and message_router:
             tg_adapter = message_router.adapters.get("telegram")
             if tg_adapter:
                 get_status = getattr(tg_adapter, "get_status", None)
-                if callable(get_status):
-                    telegram_status = get_status()
-
-        return {
-            "ok": True,
-            "chatwoot": {
-                "account_id": config.chatwoot.account_id,
-                "base_url": str(config.chatwoot.base_url),
-                "channels_configured": list(
-                    config.chatwoot.channel_by_webhook_id.values()
-                ),
-            },
-            "wasender": {
-                "enabled": wasender_enabled,
-            },
-            "telegram": {
-                "enabled": telegram_enabled,
-                "session_name": (
-                    config.telegram.session_name if telegram_enabled else None
-                ),
-                "status": telegram_status,
-            },
-            "vk": {
-                "enabled": vk_enabled,
-                # Do not expose callback_id/secret/token; group_id is safe to show
-                "group_id": config.vk.group_id if vk_enabled else None,
-            },
-        }
-
-    @router.post("/wasender/webhook/{webhook_id}", response_model=dict)
+        if not callable(get_status):
+            return _json_ack(health_bytes)
+
+        return _json_ack(
+            orjson.dumps(
+                {**health_body, "telegram": {**health_body["telegram"], "status": get_status()}}
+            )
+        )
+
+    @router.post("/wasender/webhook/{webhook_id}", include_in_schema=False)
     async def wasender_webhook(
         webhook_id: str,
-        payload: WasenderWebhookPayload,
+        request: Request,
         x_webhook_signature: str | None = Header(
             default=None, alias="X-Webhook-Signature"
         ),
     ):
         # Verify path token first
-        if webhook_id != config.wasender.webhook_id:
+        if not _safe_eq(webhook_id, config.wasender.webhook_id):
             raise HTTPException(status_code=403, detail="Invalid webhook ID")
-        # Simple header equality check (no HMAC)
-        if x_webhook_signature != config.wasender.webhook_secret:
+        body = await _read_body(request, body_limit)
+        if not _valid_wasender_signature(x_webhook_signature, config.wasender.webhook_secret, body):
             raise HTTPException(status_code=403, detail="Invalid X-Webhook-Signature")
 
-        event = payload.event
-        logger.info("[http] Wasender webhook accepted: event=%s", event)
+        # orjson no corpo bruto; só os campos usados são verificados (sem modelo completo)
+        payload = _decode_json(body)
+        event = payload.get("event")
+        data = payload.get("data")
+        if not isinstance(event, str) or not isinstance(data, dict):
+            raise HTTPException(status_code=400, detail="Invalid Wasender payload")
+        if logger.isEnabledFor(logging.INFO):
+            logger.info("[http] Wasender webhook accepted: event=%s", event)
 
         if event == "messages.upsert":
             try:
-                raw = payload.data["messages"]
-                key = raw["key"]
-                from_me = key["fromMe"]
-                bus.emit(
-                    "wasender.outgoing" if from_me else "wasender.incoming",
-                    payload.model_dump(),
-                )
+                raw = data["messages"]
+                if not isinstance(raw, list):
+                    key = raw["key"]
+                    from_me = key["fromMe"]
             except Exception as e:
                 raise HTTPException(
                     status_code=400, detail=f"Invalid upsert format: {e}"
                 )
+            if isinstance(raw, list):
+                # Várias mensagens num só upsert: um único evento; o listener itera
+                _submit(bus, "wasender.incoming.batch", payload)
+            else:
+                # Emite o dict já decodificado (validação do modelo fica no WasenderAdapter)
+                _submit(bus, "wasender.outgoing" if from_me else "wasender.incoming", payload)
         else:
-            logger.info("[wasender] Ignored event: %s", event)
+            if logger.isEnabledFor(logging.INFO):
+                logger.info("[wasender] Ignored event: %s", event)
 
-        return {"status": "ok"}
+        return _json_ack(_OK_BODY)
 
-    @router.post("/chatwoot/webhook/{webhook_id}", response_model=dict)
+    @router.post("/chatwoot/webhook/{webhook_id}", include_in_schema=False)
     async def chatwoot_webhook(webhook_id: str, request: Request):
         # Determine channel by webhook_id (per-channel hooks) or fallback to legacy id
-        channel = config.chatwoot.channel_by_webhook_id.get(webhook_id)
+        channel = _channel_for_webhook(config.chatwoot.channel_by_webhook_id, webhook_id)
         if not channel:
             raise HTTPException(status_code=403, detail="Unknown webhook ID")
 
-        payload = await request.json()
+        payload = _decode_json(await _read_body(request, body_limit))
         event = payload.get("event")
         msg_type = payload.get("message_type")
 
         # Filtrar por caixa de entrada: o webhook é por conta (Applications → Webhooks),
         # então recebemos eventos de todas as caixas; processar só os da caixa deste canal.
-        conv = payload.setdefault("conversation", {})
-        payload_inbox_raw = conv.get("inbox_id") or (conv.get("inbox") or {}).get("id")
-        expected_inbox = config.chatwoot.inbox_id_by_channel.get(channel)
+        conv = payload.get("conversation")
+        if not isinstance(conv, dict):
+            conv = payload["conversation"] = {}
+        payload_inbox_raw = conv.get("inbox_id")
+        if payload_inbox_raw is None:
+            inbox = conv.get("inbox")
+            payload_inbox_raw = inbox.get("id") if isinstance(inbox, dict) else None
+        expected_inbox = inbox_str_by_channel.get(channel)
         if expected_inbox is not None and payload_inbox_raw is not None:
-            try:
-                payload_inbox = int(payload_inbox_raw)
-                if payload_inbox != expected_inbox:
+            payload_inbox = (
+                payload_inbox_raw if isinstance(payload_inbox_raw, str) else str(payload_inbox_raw)
+            )
+            if payload_inbox != expected_inbox:
+                if logger.isEnabledFor(logging.INFO):
                     logger.info(
                         "[chatwoot] Event ignored: inbox_id=%s does not match channel %s (expected inbox=%s)",
                         payload_inbox,
                         channel,
                         expected_inbox,
                     )
-                    return {"status": "received"}
-            except (TypeError, ValueError):
-                pass
-
-        meta = conv.setdefault("meta", {})
-        if channel:
-            # Inject resolved channel so downstream router can dispatch
-            meta["channel"] = channel
-
-        logger.info(
-            "[http] Chatwoot webhook accepted: event=%s type=%s channel=%s",
-            event,
-            msg_type,
-            meta.get("channel"),
-        )
+                return _json_ack(_RECEIVED_BODY)
 
-        if event == "message_created":
-            if msg_type == "incoming":
-                bus.emit("chatwoot.incoming", payload)
-            elif msg_type == "outgoing":
-                bus.emit("chatwoot.outgoing", payload)
-            else:
-                logger.warning("[chatwoot] Unknown message_type: %s", msg_type)
+        # Inject resolved channel so downstream router can dispatch
+        # (interned: comparações/lookups por canal no router caem no fast path de identidade)
+        meta = conv.get("meta")
+        if not isinstance(meta, dict):
+            meta = conv["meta"] = {}
+        meta["channel"] = sys.intern(channel)
+
+        # Logs por requisição protegidos por nível: em WARNING não montam argumentos
+        if logger.isEnabledFor(logging.INFO):
+            logger.info(
+                "[http] Chatwoot webhook accepted: event=%s type=%s channel=%s",
+                event,
+                msg_type,
+                channel,
+            )
+
+        topic = None
+        if isinstance(event, str):
+            if isinstance(msg_type, str):
+                topic = _CHATWOOT_TOPICS.get((event, msg_type))
+            if topic is None:
+                topic = _CHATWOOT_TOPICS.get((event, None))
+        if topic is not None:
+            _submit(bus, topic, payload)
+        elif event == "message_created":
+            logger.warning("[chatwoot] Unknown message_type: %s", msg_type)
         else:
-            logger.info("[chatwoot] Ignored event: %s", event)
+            if logger.isEnabledFor(logging.INFO):
+                logger.info("[chatwoot] Ignored event: %s", event)
 
-        return {"status": "received"}
+        return _json_ack(_RECEIVED_BODY)
 
-    @router.post("/vk/callback/{callback_id}", response_class=PlainTextResponse)
+    @router.post(
+        "/vk/callback/{callback_id}", response_class=PlainTextResponse, include_in_schema=False
+    )
     async def vk_callback(callback_id: str, request: Request) -> PlainTextResponse:
         """
         VK Callback endpoint with path-based security and confirmation support.
@@ -209,19 +376,17 @@ def create_router(
             raise HTTPException(status_code=503, detail="VK adapter is not configured")
 
         # Verify callback_id from path
-        if callback_id != config.vk.callback_id:
+        if not _safe_eq(callback_id, config.vk.callback_id):
             raise HTTPException(status_code=403, detail="Invalid callback ID")
 
-        try:
-            payload: Dict[str, Any] = await request.json()
-        except Exception:
-            raise HTTPException(status_code=400, detail="Invalid JSON body")
+        payload: Dict[str, Any] = _decode_json(await _read_body(request, body_limit))
 
         event_type = payload.get("type")
         group_id = payload.get("group_id")
         secret = payload.get("secret")
 
-        logger.info("[vk] event received: type=%s group_id=%s", event_type, group_id)
+        if logger.isEnabledFor(logging.INFO):
+            logger.info("[vk] event received: type=%s group_id=%s", event_type, group_id)
 
         # Handle confirmation (no secret required)
         if event_type == "confirmation":
@@ -229,10 +394,10 @@ def create_router(
                 raise HTTPException(status_code=400, detail="Invalid group_id")
             # Optional: emit confirmation event for debugging/metrics
             bus.emit("vk.confirmation", {"group_id": group_id})
-            return PlainTextResponse(config.vk.confirmation)
+            return _text_ack(vk_confirmation_body)
 
         # For all other events, verify secret and group_id
-        if secret != config.vk.secret:
+        if not _safe_eq(secret, config.vk.secret):
             raise HTTPException(status_code=403, detail="Invalid secret")
         if group_id != config.vk.group_id:
             raise HTTPException(status_code=400, detail="Invalid group_id")
@@ -241,21 +406,23 @@ def create_router(
             try:
                 obj = payload.get("object") or {}
                 message = obj.get("message") or {}
-                # Emit unified internal event; VkAdapter will convert to UnifiedMessage
-                bus.emit(
-                    "vk.incoming",
-                    {"event": "message_new", "message": message, "raw": payload},
-                )
             except Exception as e:
                 raise HTTPException(
                     status_code=400, detail=f"Invalid message_new payload: {e}"
                 )
+            # Emit unified internal event; VkAdapter will convert to UnifiedMessage
+            _submit(
+                bus,
+                "vk.incoming",
+                {"event": "message_new", "message": message, "raw": payload},
+            )
         else:
             # Acknowledge other events to prevent VK retries
-            logger.info("[vk] ignored event type: %s", event_type)
+            if logger.isEnabledFor(logging.INFO):
+                logger.info("[vk] ignored event type: %s", event_type)
 
         # VK requires literal 'ok' to acknowledge processing
-        return PlainTextResponse("ok")
+        return _text_ack(_VK_OK_BODY)
 
     # Endpoints de disparo manual e membros (requerem DISPATCH_API_TOKEN)
     if config.dispatch_api_token and message_router is not None:
@@ -264,19 +431,24 @@ def create_router(
             account_id=config.chatwoot.account_id,
             base_url=str(config.chatwoot.base_url),
         )
+        _chatwoot_clients.append(_cw_client)
         _cw_service = ChatwootService(client=_cw_client)
 
-        def _check_dispatch_token(authorization: str | None = Header(default=None)):
-            if not authorization or not authorization.startswith("Bearer "):
+        # Token esperado já em bytes: a comparação do header não re-codifica por pedido
+        dispatch_token = config.dispatch_api_token.encode("utf-8")
+
+        # Chamado diretamente nas rotas async (não é Depends): corre no event loop, sem threadpool
+        def _check_dispatch_token(authorization: str | None) -> None:
+            auth = authorization.encode("utf-8") if authorization else b""
+            if not auth.startswith(_BEARER):
                 raise HTTPException(
                     status_code=401,
                     detail="Header Authorization: Bearer <token> obrigatório",
                 )
-            token = authorization[7:].strip()
-            if token != config.dispatch_api_token:
+            if not hmac.compare_digest(auth[len(_BEARER) :].strip(), dispatch_token):
                 raise HTTPException(status_code=403, detail="Token inválido")
 
-        @router.get("/telegram/members/next", response_model=dict)
+        @router.get("/telegram/members/next")
         async def telegram_members_next(
             authorization: str | None = Header(default=None, alias="Authorization"),
         ):
@@ -308,7 +480,7 @@ def create_router(
             except RuntimeError as e:
                 raise HTTPException(status_code=503, detail=str(e))
 
-        @router.post("/telegram/members/reset", response_model=dict)
+        @router.post("/telegram/members/reset")
         async def telegram_members_reset(
             authorization: str | None = Header(default=None, alias="Authorization"),
         ):
@@ -327,7 +499,7 @@ def create_router(
             count = reset_fn()
             return {"status": "ok", "previous_count": count}
 
-        @router.post("/dispatch", response_model=dict)
+        @router.post("/dispatch")
         async def dispatch(
             body: DispatchBody,
             authorization: str | None = Header(default=None, alias="Authorization"),
@@ -15,6 +15,9 @@ OnMessage = Callable[[UnifiedMessage], Awaitable[None]]
 class MessengerAdapter(Protocol):
     """Minimal contract each channel adapter must implement."""
 
+    # Sem __dict__ aqui: os adapters podem declarar os seus __slots__
+    __slots__ = ()
+
     def on_message(self, cb: OnMessage) -> None: ...
     async def start(self) -> None: ...
     async def stop(self) -> None: ...
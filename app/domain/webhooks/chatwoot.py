@@ -1,6 +1,6 @@
 from typing import Optional
 
-from pydantic import BaseModel
+from pydantic import BaseModel, ConfigDict
 
 
 class ChatwootConversationMeta(BaseModel):
@@ -20,3 +20,17 @@ class ChatwootMessageCreatedWebhook(BaseModel):
     private: Optional[bool] = None
     content: Optional[str] = None
     conversation: ChatwootConversation = ChatwootConversation()
+
+
+class ChatwootMessageGate(BaseModel):
+    """
+    Slim view of message_created with only the fields the router gates on.
+    conversation is not parsed here (the router reads channel/sender from the raw payload).
+    """
+
+    model_config = ConfigDict(extra="ignore")
+
+    event: str
+    message_type: Optional[str] = None
+    private: Optional[bool] = None
+    content: Optional[str] = None
@@ -5,16 +5,27 @@ import os
 import random
 import re
 import tempfile
-from typing import Optional, Tuple, Union
+import time
+import urllib.parse
+from array import array
+from bisect import bisect_left
+from collections import OrderedDict, deque
+from operator import attrgetter
+from typing import Any, Optional, Tuple, Union
 
-from pyee.asyncio import AsyncIOEventEmitter
 from telethon import TelegramClient, errors, events, functions, types
 
 import httpx
+from mutagen import File as MutagenFile
+from mutagen.mp3 import MP3
+from mutagen.mp4 import MP4
+from mutagen.oggopus import OggOpus
+from mutagen.oggvorbis import OggVorbis
 
 from app.config import TelegramConfig
 from app.domain.message import MediaContent, TextContent
 from app.domain.ports import MessengerAdapter, OnMessage
+from app.infra.bus import EventBus
 
 logger = logging.getLogger(__name__)
 
@@ -30,6 +41,57 @@ RECORD_AUDIO_EXTRA_SECONDS = 4
 RECORD_AUDIO_VARIATION_PERCENT = 0.05  # ±5%
 # Fallback por transcrição: ~19 caracteres/s (velocidade de fala ElevenLabs)
 RECORD_AUDIO_CHARS_PER_SECOND = 19
+# Cache de entidades resolvidas por recipient_id (evita lookups na sessão/ImportContacts
+# repetidos em disparos em massa); LRU limitado com TTL
+ENTITY_CACHE_MAX = 2048
+ENTITY_CACHE_TTL_SEC = 3600.0
+# Download de media em blocos (sem manter o ficheiro inteiro em memória)
+MEDIA_DOWNLOAD_CHUNK_SIZE = 64 * 1024
+# Downloads de áudio recebido em paralelo (os handlers do Telethon correm cada um na sua
+# task; numa rajada de voice notes isto limita as ligações/ficheiros abertos)
+MEDIA_DOWNLOAD_CONCURRENCY = 4
+# Última mensagem recebida por user_id (max_id do "lido" sem get_messages); LRU limitado
+READ_STATE_CACHE_MAX = 2048
+# Mensagens recebidas no mesmo chat em rajada (álbum, várias msgs seguidas): a primeira
+# segue logo; as que chegam durante esta janela são emitidas num só telegram.incoming.batch
+INCOMING_COALESCE_SEC = 0.2
+INCOMING_COALESCE_MAX = 50
+# Participantes pedidos por página em /telegram/members/next (máx. do GetParticipants)
+MEMBERS_PAGE_SIZE = 200
+# Telegram cancela o typing após ~5s se não for reenviado: reenviar a cada 4s
+TYPING_REFRESH_SECONDS = 4.0
+
+# Tabela de valores aleatórios em [0, 1) para as variações de delay; reabastecida
+# a cada volta completa (a sequência não se repete entre voltas)
+JITTER_TABLE_SIZE = 4096
+# Abaixo deste tempo base (s) a variação de ±5-15% é imperceptível: usa-se o valor base
+JITTER_MIN_BASE_SECONDS = 0.25
+# Gerador próprio para o jitter: não é afetado por random.seed() noutras partes do processo
+# e pode ser semeado à parte (_jitter_rng.seed(n)) para reproduzir os delays
+_jitter_rng = random.Random()
+_jitter_table = array("d")
+_jitter_pos = 0
+
+
+def _jitter(percent: float) -> float:
+    """Variação aleatória uniforme em [-percent, +percent) lida da tabela pré-calculada."""
+    global _jitter_table, _jitter_pos
+    if _jitter_pos >= len(_jitter_table):
+        rand = _jitter_rng.random
+        _jitter_table = array("d", [rand() for _ in range(JITTER_TABLE_SIZE)])
+        _jitter_pos = 0
+    r = _jitter_table[_jitter_pos]
+    _jitter_pos += 1
+    return (r * 2 - 1) * percent
+
+
+# Formatos candidatos por extensão: o mutagen só testa estes em vez de todos os que conhece
+# (.ogg pode ser Opus ou Vorbis; extensão desconhecida ou sem match -> deteção completa)
+_MUTAGEN_BY_EXT = {
+    ".ogg": [OggOpus, OggVorbis],
+    ".m4a": [MP4],
+    ".mp3": [MP3],
+}
 
 
 def get_audio_duration_seconds(file_path: str) -> Optional[float]:
@@ -38,20 +100,53 @@ def get_audio_duration_seconds(file_path: str) -> Optional[float]:
     Usa mutagen para ler metadados. Retorna None se não conseguir.
     """
     try:
-        from mutagen import File as MutagenFile
-
-        audio = MutagenFile(file_path)
+        options = _MUTAGEN_BY_EXT.get(os.path.splitext(file_path)[1].lower())
+        audio = MutagenFile(file_path, options=options) if options else None
+        if audio is None:
+            audio = MutagenFile(file_path)
         if audio is not None and hasattr(audio, "info") and hasattr(audio.info, "length"):
             return float(audio.info.length)
-    except Exception:  # mutagen não instalado, formato não suportado, ficheiro inválido
+    except Exception:  # formato não suportado, ficheiro inválido
         pass
     return None
 
 
+# (username, first_name, id) de um User Telethon num só passo
+_user_fields = attrgetter("username", "first_name", "id")
+
+
+def _user_info(user: Any) -> Tuple[Optional[str], Optional[str], Optional[int]]:
+    """Campos do remetente/destinatário; getattr com default só se não for um User (ou None)."""
+    try:
+        return _user_fields(user)
+    except AttributeError:
+        return (
+            getattr(user, "username", None),
+            getattr(user, "first_name", None),
+            getattr(user, "id", None),
+        )
+
+
+def _file_has_content(path: str, data: bytes) -> bool:
+    """True if the file at path exists and holds exactly data (size checked first)."""
+    try:
+        if os.path.getsize(path) != len(data):
+            return False
+        with open(path, "rb") as f:
+            return f.read() == data
+    except OSError:
+        return False
+
+
+def _tmp_path(suffix: str) -> str:
+    """Caminho temporário aleatório (sem criar o ficheiro: quem escreve abre-o uma só vez)."""
+    return os.path.join(tempfile.gettempdir(), f"tg_{os.urandom(8).hex()}{suffix}")
+
+
 def record_audio_delay_from_duration(duration_seconds: float) -> float:
     """Duração do indicador 'gravando': duração real + 4s preparação, com ±5% variação."""
     base = duration_seconds + RECORD_AUDIO_EXTRA_SECONDS
-    variation = (random.random() * 2 * RECORD_AUDIO_VARIATION_PERCENT) - RECORD_AUDIO_VARIATION_PERCENT
+    variation = _jitter(RECORD_AUDIO_VARIATION_PERCENT)
     return base * (1 + variation)
 
 
@@ -61,7 +156,9 @@ def record_audio_delay_from_transcript(transcript: str) -> float:
     if char_count == 0:
         return RECORD_AUDIO_EXTRA_SECONDS
     base_seconds = char_count / RECORD_AUDIO_CHARS_PER_SECOND
-    variation = (random.random() * 2 * RECORD_AUDIO_VARIATION_PERCENT) - RECORD_AUDIO_VARIATION_PERCENT
+    if base_seconds < JITTER_MIN_BASE_SECONDS:
+        return base_seconds + RECORD_AUDIO_EXTRA_SECONDS
+    variation = _jitter(RECORD_AUDIO_VARIATION_PERCENT)
     return base_seconds * (1 + variation) + RECORD_AUDIO_EXTRA_SECONDS
 
 
@@ -86,14 +183,16 @@ def calculate_typing_delay(text: str) -> Tuple[float, int, int]:
     
     # Adiciona uma variação aleatória de ±15% para parecer mais humano
     # variation = (Math.random() * 0.3) - 0.15 => -0.15 a +0.15
-    variation = (random.random() * 0.3) - 0.15
-    total_seconds = base_seconds * (1 + variation)
+    # (textos muito curtos: variação irrelevante, fica o tempo base)
+    if base_seconds < JITTER_MIN_BASE_SECONDS:
+        total_seconds = base_seconds
+    else:
+        total_seconds = base_seconds * (1 + _jitter(TYPING_VARIATION_PERCENT))
     
     # Separa segundos e milissegundos
-    seconds = int(total_seconds)
-    milliseconds = round((total_seconds - seconds) * 1000)
+    seconds, fraction = divmod(total_seconds, 1)
     
-    return (total_seconds, seconds, milliseconds)
+    return (total_seconds, int(seconds), round(fraction * 1000))
 
 # Accept @username or plain username (min length 5)
 USERNAME_RE = re.compile(r"^@?[A-Za-z0-9_]{5,}$")
@@ -104,7 +203,26 @@ PHONE_RE = re.compile(r"^\+?\d{7,15}$")
 class TelegramAdapter(MessengerAdapter):
     """Telegram adapter (text only) using native Telethon client (non-bot)."""
 
-    def __init__(self, bus: AsyncIOEventEmitter, config: TelegramConfig):
+    __slots__ = (
+        "bus",
+        "_cfg",
+        "inbox_id",
+        "client",
+        "_cb",
+        "_members_offset",
+        "_members_buffer",
+        "_members_returned",
+        "_entity_cache",
+        "_local_attach_root",
+        "_local_attach_prefix",
+        "_http",
+        "_read_state",
+        "_incoming_pending",
+        "_incoming_timers",
+        "_download_sem",
+    )
+
+    def __init__(self, bus: EventBus, config: TelegramConfig):
         self.bus = bus
         self._cfg = config
         self.inbox_id = config.inbox_id  # expose per-channel inbox
@@ -112,8 +230,28 @@ class TelegramAdapter(MessengerAdapter):
         self._cb: Optional[OnMessage] = None
         # Offset para iterar membros do grupo (usado pelo endpoint /telegram/members/next)
         self._members_offset: int = 0
-        # IDs já retornados (para não repetir)
-        self._members_returned: set[int] = set()
+        # Participantes já pedidos ao Telegram e ainda não retornados (página corrente)
+        self._members_buffer: "deque[Any]" = deque()
+        # IDs já retornados (para não repetir): array ordenado de int64 (8 bytes/ID em vez
+        # de um int Python + slot de set), pesquisa por bisect
+        self._members_returned = array("q")
+        # Telefone ou "id:<user_id>" -> (timestamp, entity)
+        self._entity_cache: "OrderedDict[str, Tuple[float, Any]]" = OrderedDict()
+        # Anexos do Chatwoot montados localmente (opcional): URLs que começam por
+        # CHATWOOT_ATTACH_LOCAL_PREFIX (ou file://) mapeiam para ficheiros dentro de
+        # CHATWOOT_ATTACH_LOCAL_DIR e são enviados diretamente, sem download
+        local_root = os.getenv("CHATWOOT_ATTACH_LOCAL_DIR", "").strip()
+        self._local_attach_root: Optional[str] = os.path.realpath(local_root) if local_root else None
+        self._local_attach_prefix = os.getenv("CHATWOOT_ATTACH_LOCAL_PREFIX", "").strip()
+        # Cliente HTTP para descarregar media (keep-alive entre envios; fechado em stop)
+        self._http: Optional[httpx.AsyncClient] = None
+        # user_id -> [id da última mensagem recebida, já marcada como lida?]
+        self._read_state: "OrderedDict[int, list]" = OrderedDict()
+        # chat_id -> mensagens recebidas à espera do flush; lista vazia = janela aberta
+        # sem pendentes (ver _queue_incoming)
+        self._incoming_pending: dict[str, list[dict]] = {}
+        self._incoming_timers: dict[str, asyncio.TimerHandle] = {}
+        self._download_sem = asyncio.Semaphore(MEDIA_DOWNLOAD_CONCURRENCY)
 
     def on_message(self, cb: OnMessage) -> None:
         self._cb = cb
@@ -132,12 +270,24 @@ class TelegramAdapter(MessengerAdapter):
             session_b64 = os.getenv("TG_SESSION_BASE64", "").strip()
             if session_b64:
                 try:
-                    data = base64.b64decode(session_b64, validate=True)
-                    with open(session_path, "wb") as f:
-                        f.write(data)
-                    logger.info(
-                        "[telegram] session file written from TG_SESSION_BASE64"
-                    )
+                    raw = base64.b64decode(session_b64, validate=True)
+                    if _file_has_content(session_path, raw):
+                        # Reinício com a mesma sessão: não reescrever o ficheiro
+                        logger.info(
+                            "[telegram] session file already matches TG_SESSION_BASE64"
+                        )
+                    else:
+                        data = memoryview(raw)
+                        # Escrita direta no fd (sem BufferedWriter); 0o600: a sessão é credencial
+                        fd = os.open(session_path, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o600)
+                        try:
+                            while data:
+                                data = data[os.write(fd, data):]
+                        finally:
+                            os.close(fd)
+                        logger.info(
+                            "[telegram] session file written from TG_SESSION_BASE64"
+                        )
                 except Exception as e:
                     logger.warning(
                         "[telegram] failed to write session from TG_SESSION_BASE64: %s",
@@ -166,50 +316,33 @@ class TelegramAdapter(MessengerAdapter):
             )
             if peer is None or not isinstance(peer, types.PeerUser):
                 return
+            self._remember_incoming(peer.user_id, getattr(event, "id", None))
             # Extract sender details
             sender = await event.get_sender()
-            username = getattr(sender, "username", None)
-            first_name = getattr(sender, "first_name", None)
-            from_id = getattr(sender, "id", None)
+            username, first_name, from_id = _user_info(sender)
+            text = event.text or ""
 
             # Build message payload for internal bus
             payload = {
-                "text": event.text or "",
+                "text": text,
                 "from_id": str(from_id) if from_id else None,
                 "username": username,
                 "name": first_name or username or str(from_id),
             }
             # Áudio/voice: descarregar e anexar ao payload
-            msg = getattr(event, "message", event)
-            media = getattr(msg, "media", None)
-            is_voice = bool(getattr(msg, "voice", False))
-            is_audio = bool(getattr(msg, "audio", False))
-            if media is not None and (is_voice or is_audio):
-                try:
-                    ext = ".ogg" if is_voice else ".m4a"
-                    fd, path = tempfile.mkstemp(suffix=ext)
-                    os.close(fd)
-                    await self.client.download_media(msg, file=path)
-                    payload["attachment_path"] = path
-                    payload["attachment_content_type"] = (
-                        "audio/ogg" if is_voice else "audio/mpeg"
-                    )
-                    if not payload["text"]:
-                        payload["text"] = ""
-                    logger.info(
-                        "[telegram] INCOMING: from=%s áudio/voice -> Chatwoot",
-                        from_id,
-                    )
-                except Exception as e:
-                    logger.warning("[telegram] download media failed: %s", e)
-            if "attachment_path" not in payload:
+            if await self._attach_audio(event, payload, "download media failed"):
+                logger.info(
+                    "[telegram] INCOMING: from=%s áudio/voice -> Chatwoot",
+                    from_id,
+                )
+            elif logger.isEnabledFor(logging.INFO):
                 logger.info(
                     "[telegram] INCOMING: from=%s (@%s) text=%r -> será enviado ao Chatwoot",
                     from_id,
                     username or "-",
-                    (payload["text"] or "")[:80],
+                    text[:80],
                 )
-            self.bus.emit("telegram.incoming", payload)
+            self._queue_incoming(str(peer.user_id), payload)
 
         # Mensagens enviadas por ti (disparos) -> enviar ao Chatwoot como outgoing
         @self.client.on(events.NewMessage(outgoing=True))
@@ -224,58 +357,43 @@ class TelegramAdapter(MessengerAdapter):
                 if not isinstance(peer, types.PeerUser):
                     return
                 recipient = await self.client.get_entity(peer)
-                username = getattr(recipient, "username", None)
-                first_name = getattr(recipient, "first_name", None)
-                rid = getattr(recipient, "id", None)
+                username, first_name, rid = _user_info(recipient)
+                text = event.text or ""
                 payload = {
-                    "text": event.text or "",
+                    "text": text,
                     "to_id": str(rid) if rid else None,
                     "username": username,
                     "name": first_name or username or (str(rid) if rid else "?"),
                 }
                 # Áudio/voice nos disparos
-                msg = getattr(event, "message", event)
-                media = getattr(msg, "media", None)
-                is_voice = bool(getattr(msg, "voice", False))
-                is_audio = bool(getattr(msg, "audio", False))
-                if media is not None and (is_voice or is_audio):
-                    try:
-                        ext = ".ogg" if is_voice else ".m4a"
-                        fd, path = tempfile.mkstemp(suffix=ext)
-                        os.close(fd)
-                        await self.client.download_media(msg, file=path)
-                        payload["attachment_path"] = path
-                        payload["attachment_content_type"] = (
-                            "audio/ogg" if is_voice else "audio/mpeg"
-                        )
-                        if not payload["text"]:
-                            payload["text"] = ""
-                        logger.info(
-                            "[telegram] OUTGOING (disparo): to=%s áudio/voice -> Chatwoot",
-                            rid,
-                        )
-                    except Exception as e:
-                        logger.warning("[telegram] download media (outgoing) failed: %s", e)
-                else:
+                attached = await self._attach_audio(
+                    event, payload, "download media (outgoing) failed"
+                )
+                if attached:
+                    logger.info(
+                        "[telegram] OUTGOING (disparo): to=%s áudio/voice -> Chatwoot",
+                        rid,
+                    )
+                elif attached is None and logger.isEnabledFor(logging.INFO):
                     logger.info(
                         "[telegram] OUTGOING (disparo): to=%s (@%s) text=%r -> Chatwoot",
                         rid,
                         username or "-",
-                        (payload["text"] or "")[:80],
+                        text[:80],
                     )
                 self.bus.emit("telegram.outgoing", payload)
             except Exception as e:
                 logger.warning("[telegram] handle_outgoing failed: %s", e)
 
-        # Be gentle
-        await asyncio.sleep(2)
-        me = await self.client.get_me()
-        logger.info(f"[telegram] logged in as {me.username}")
-
-        # Wait before doing anything else
-        await asyncio.sleep(1)
+        # Be gentle: a pausa corre em paralelo com os pedidos iniciais em vez de os atrasar
+        me, _, authorized = await asyncio.gather(
+            self.client.get_me(),
+            asyncio.sleep(1),
+            self.client.is_user_authorized(),
+        )
+        logger.info("[telegram] logged in as %s", me.username)
 
-        if not await self.client.is_user_authorized():
+        if not authorized:
             logger.warning(
                 "[telegram] session '%s' is not authorized. "
                 "Authorize once with Telethon to create the session file.",
@@ -291,11 +409,85 @@ class TelegramAdapter(MessengerAdapter):
 
         logger.info("[telegram] adapter started (native client, text only)")
 
+    async def _attach_audio(self, event: Any, payload: dict, failure_msg: str) -> Optional[bool]:
+        """
+        Voice/áudio na mensagem: descarrega para um ficheiro temporário e junta
+        attachment_path/attachment_content_type ao payload (usado por ambos os handlers).
+        Devolve True se anexou, False se o download falhou, None se não há áudio.
+        """
+        msg = getattr(event, "message", event)
+        is_voice = bool(getattr(msg, "voice", False))
+        if getattr(msg, "media", None) is None or not (is_voice or getattr(msg, "audio", False)):
+            return None
+        try:
+            path = _tmp_path(".ogg" if is_voice else ".m4a")
+            async with self._download_sem:
+                await self.client.download_media(msg, file=path)
+        except Exception as e:
+            logger.warning("[telegram] %s: %s", failure_msg, e)
+            return False
+        payload["attachment_path"] = path
+        payload["attachment_content_type"] = "audio/ogg" if is_voice else "audio/mpeg"
+        return True
+
+    def _queue_incoming(self, key: str, payload: dict) -> None:
+        """
+        Sem janela aberta para o chat: emite já e abre a janela. Durante a janela junta as
+        mensagens seguintes, emitidas juntas no fim (rajada) ou ao atingir o máximo.
+        """
+        pending = self._incoming_pending.get(key)
+        if pending is None:
+            self._incoming_pending[key] = []
+            self._incoming_timers[key] = asyncio.get_running_loop().call_later(
+                INCOMING_COALESCE_SEC, self._flush_incoming, key
+            )
+            self.bus.emit("telegram.incoming", payload)
+            return
+        pending.append(payload)
+        if len(pending) >= INCOMING_COALESCE_MAX:
+            self._incoming_timers.pop(key).cancel()
+            self._flush_incoming(key)
+
+    def _flush_incoming(self, key: str) -> None:
+        """Uma mensagem -> telegram.incoming (como antes); várias -> telegram.incoming.batch."""
+        self._incoming_timers.pop(key, None)
+        batch = self._incoming_pending.pop(key, None)
+        if not batch:
+            return
+        if len(batch) == 1:
+            self.bus.emit("telegram.incoming", batch[0])
+        else:
+            from_id = batch[0].get("from_id") or key
+            self.bus.emit("telegram.incoming.batch", {"from_id": from_id, "messages": batch})
+
     async def stop(self) -> None:
+        # Emitir as mensagens ainda na janela de agrupamento; close_events (a seguir no
+        # shutdown) drena as filas de eventos antes de parar os workers
+        for key, timer in list(self._incoming_timers.items()):
+            timer.cancel()
+            self._flush_incoming(key)
         if self.client and self.client.is_connected():
             await self.client.disconnect()
+        if self._http is not None:
+            await self._http.aclose()
+            self._http = None
         logger.info("[telegram] adapter stopped")
 
+    def _get_http(self) -> httpx.AsyncClient:
+        """Return the shared media download client, creating it on first use."""
+        if self._http is None:
+            self._http = httpx.AsyncClient(
+                timeout=30.0,
+                follow_redirects=True,
+                http2=True,
+                limits=httpx.Limits(
+                    max_keepalive_connections=20,
+                    max_connections=100,
+                    keepalive_expiry=30.0,
+                ),
+            )
+        return self._http
+
     def get_status(self) -> dict:
         """Retorna estado do adapter para diagnóstico (usado no /health)."""
         return {
@@ -318,36 +510,86 @@ class TelegramAdapter(MessengerAdapter):
 
         try:
             group = await self.client.get_entity(group_invite)
+            if isinstance(group, types.Channel):
+                # Supergrupo/canal: continuar da página onde a chamada anterior parou
+                while True:
+                    if not self._members_buffer and not await self._fetch_members_page(group):
+                        # Todos os membros já foram retornados
+                        return None
+                    member = self._claim_member(self._members_buffer.popleft())
+                    if member is not None:
+                        return member
+            # Grupo básico: lista completa numa só resposta (GetFullChat)
             async for participant in self.client.iter_participants(group):
-                pid = getattr(participant, "id", None)
-                if pid is None:
-                    continue
-                # Já retornado antes? Pular
-                if pid in self._members_returned:
-                    continue
-                # Marcar como retornado
-                self._members_returned.add(pid)
-                # Construir resposta (user_id e access_hash como string para evitar
-                # perda de precisão em JSON/JavaScript com números de 64 bits)
-                access_hash_raw = getattr(participant, "access_hash", None)
-                return {
-                    "user_id": str(pid),
-                    "access_hash": str(access_hash_raw) if access_hash_raw is not None else None,
-                    "username": getattr(participant, "username", None),
-                    "first_name": getattr(participant, "first_name", None),
-                    "last_name": getattr(participant, "last_name", None),
-                    "phone": getattr(participant, "phone", None),
-                }
+                member = self._claim_member(participant)
+                if member is not None:
+                    return member
             # Todos os membros já foram retornados
             return None
         except Exception as e:
             logger.exception("[telegram] get_next_member failed: %s", e)
             raise RuntimeError(f"Falha ao obter próximo membro: {e}") from e
 
+    async def _fetch_members_page(self, group: types.Channel) -> bool:
+        """
+        Carrega a próxima página de participantes a partir de _members_offset para o buffer.
+        Devolve False quando não há mais participantes.
+        """
+        result = await self.client(
+            functions.channels.GetParticipantsRequest(
+                channel=group,
+                filter=types.ChannelParticipantsSearch(""),
+                offset=self._members_offset,
+                limit=MEMBERS_PAGE_SIZE,
+                hash=0,
+            )
+        )
+        participants = getattr(result, "participants", None) or []
+        if not participants:
+            return False
+        self._members_offset += len(participants)
+        users = {u.id: u for u in result.users}
+        for p in participants:
+            if isinstance(p, types.ChannelParticipantLeft):
+                continue
+            user_id = getattr(p, "user_id", None)
+            if user_id is None:  # ChannelParticipantBanned usa peer
+                user_id = getattr(getattr(p, "peer", None), "user_id", None)
+            user = users.get(user_id)
+            if user is not None:
+                self._members_buffer.append(user)
+        return True
+
+    def _claim_member(self, participant: Any) -> Optional[dict]:
+        """Marca o participante como retornado; None se já tinha sido retornado."""
+        pid = getattr(participant, "id", None)
+        if pid is None:
+            return None
+        # Já retornado antes? Pular
+        returned = self._members_returned
+        i = bisect_left(returned, pid)
+        if i < len(returned) and returned[i] == pid:
+            return None
+        # Marcar como retornado (mantém a ordem)
+        returned.insert(i, pid)
+        # Construir resposta (user_id e access_hash como string para evitar
+        # perda de precisão em JSON/JavaScript com números de 64 bits)
+        access_hash_raw = getattr(participant, "access_hash", None)
+        return {
+            "user_id": str(pid),
+            "access_hash": str(access_hash_raw) if access_hash_raw is not None else None,
+            "username": getattr(participant, "username", None),
+            "first_name": getattr(participant, "first_name", None),
+            "last_name": getattr(participant, "last_name", None),
+            "phone": getattr(participant, "phone", None),
+        }
+
     def reset_members_iterator(self) -> int:
         """Reinicia o iterador de membros. Retorna quantos tinham sido retornados antes do reset."""
         count = len(self._members_returned)
-        self._members_returned.clear()
+        self._members_returned = array("q")
+        self._members_offset = 0
+        self._members_buffer.clear()
         logger.info("[telegram] members iterator reset (was at %s)", count)
         return count
 
@@ -369,38 +611,48 @@ class TelegramAdapter(MessengerAdapter):
         if not rid:
             raise ValueError("recipient_id is empty")
 
-        # Username: Telethon accepts both with and without leading '@'
-        if USERNAME_RE.match(rid):
-            return rid.lstrip("@")
-
-        # Phone number: import to contacts first, then you can send by the number
-        if PHONE_RE.match(rid):
-            await self.client(
-                functions.contacts.ImportContactsRequest(
-                    contacts=[
-                        types.InputPhoneContact(
-                            client_id=0, phone=rid, first_name="", last_name=""
-                        )
-                    ]
+        # Despacho pelo primeiro carácter: só o regex do ramo escolhido é avaliado
+        # ("+" nunca é username; "id:" nunca é username nem telefone)
+        if rid[0] == "+":
+            # Phone number: import to contacts first, then you can send by the number
+            if PHONE_RE.match(rid):
+                if self._cached_entity(rid) is not None:
+                    return rid
+                await self.client(
+                    functions.contacts.ImportContactsRequest(
+                        contacts=[
+                            types.InputPhoneContact(
+                                client_id=0, phone=rid, first_name="", last_name=""
+                            )
+                        ]
+                    )
                 )
-            )
-            return rid
-
-        # Explicit "id:<int>" format
-        if rid.startswith("id:"):
+                self._remember_entity(rid, rid)
+                return rid
+        elif rid.startswith("id:"):
+            # Explicit "id:<int>" format
             rid = rid[3:].strip()
+        elif USERNAME_RE.match(rid):
+            # Username: Telethon accepts both with and without leading '@'
+            # (sequências só de dígitos com 5+ caracteres também caem aqui, como antes)
+            return rid.lstrip("@")
 
         # Bare integer: try to resolve as user_id (works only if session knows user)
         if rid.isdigit():
             user_id = int(rid)
+            cached = self._cached_entity(f"id:{user_id}")
+            if cached is not None:
+                return cached
             try:
-                return await self.client.get_entity(user_id)
+                entity = await self.client.get_entity(user_id)
             except (ValueError, errors.rpcerrorlist.PeerIdInvalidError):
                 logger.warning("[telegram] get_entity(%s) failed — user not in session cache", user_id)
                 raise RuntimeError(
                     f"Destinatário '{rid}' não encontrado na sessão. "
                     "Use o endpoint /telegram/members/next para obter o access_hash e envie com access_hash no /dispatch."
                 )
+            self._remember_entity(f"id:{user_id}", entity)
+            return entity
 
         # Anything else is not supported
         raise ValueError("recipient_id must be @username, phone number, or id:<int>")
@@ -419,7 +671,37 @@ class TelegramAdapter(MessengerAdapter):
             rid = rid[3:].strip()
         if not rid.isdigit():
             return None
-        return types.InputPeerUser(int(rid), access_hash)
+        user_id = int(rid)
+        entity = types.InputPeerUser(user_id, access_hash)
+        # Envios seguintes sem access_hash (ex.: resposta via Chatwoot) reutilizam a entidade
+        self._remember_entity(f"id:{user_id}", entity)
+        return entity
+
+    def _cached_entity(self, key: str) -> Any:
+        hit = self._entity_cache.get(key)
+        if hit is None:
+            return None
+        ts, entity = hit
+        if time.monotonic() - ts > ENTITY_CACHE_TTL_SEC:
+            del self._entity_cache[key]
+            return None
+        self._entity_cache.move_to_end(key)
+        return entity
+
+    def _forget_entity(self, recipient_id: str) -> None:
+        """Entidade em cache rejeitada pelo Telegram (ex.: access_hash antigo): resolver de novo."""
+        rid = (recipient_id or "").strip()
+        self._entity_cache.pop(rid, None)
+        if rid.startswith("id:"):
+            rid = rid[3:].strip()
+        if rid.isdigit():
+            self._entity_cache.pop(f"id:{int(rid)}", None)
+
+    def _remember_entity(self, key: str, entity: Any) -> None:
+        self._entity_cache[key] = (time.monotonic(), entity)
+        self._entity_cache.move_to_end(key)
+        while len(self._entity_cache) > ENTITY_CACHE_MAX:
+            self._entity_cache.popitem(last=False)
 
     async def set_typing(
         self, recipient_id: str, typing: bool = True, access_hash: Optional[int] = None
@@ -451,17 +733,67 @@ class TelegramAdapter(MessengerAdapter):
         except Exception as e:
             logger.debug("[telegram] set_typing failed: %s", e)
 
-    async def _mark_as_read(self, entity: Union[types.InputPeerUser, object]) -> None:
+    async def _typing_keepalive(
+        self, entity: Union[types.InputPeerUser, object], action: object
+    ) -> None:
+        """Reenvia o indicador (typing/gravando) até ser cancelado; falhas terminam o refresh."""
+        try:
+            while True:
+                await self.client(
+                    functions.messages.SetTypingRequest(
+                        peer=entity,
+                        action=action,
+                    )
+                )
+                await asyncio.sleep(TYPING_REFRESH_SECONDS)
+        except Exception as typing_err:
+            logger.warning("[telegram] typing failed (continuing): %s", typing_err)
+
+    async def _simulate_typing(
+        self, entity: Union[types.InputPeerUser, object], action: object, total_seconds: float
+    ) -> None:
+        """
+        Mantém o indicador visível durante total_seconds: o refresh corre numa task à parte
+        e o envio espera um único sleep, cancelando o refresh no fim.
+        """
+        keepalive = asyncio.create_task(self._typing_keepalive(entity, action))
+        try:
+            await asyncio.sleep(total_seconds)
+        finally:
+            keepalive.cancel()
+            await asyncio.gather(keepalive, return_exceptions=True)
+
+    def _remember_incoming(self, user_id: int, msg_id: Optional[int]) -> None:
+        if not msg_id:
+            return
+        self._read_state[user_id] = [msg_id, False]
+        self._read_state.move_to_end(user_id)
+        while len(self._read_state) > READ_STATE_CACHE_MAX:
+            self._read_state.popitem(last=False)
+
+    async def _mark_as_read(
+        self, entity: Union[types.InputPeerUser, object], max_id: Optional[int] = None
+    ) -> None:
         """
         Marca a conversa como lida (envia "lido" / read receipt) para o destinatário.
         Só utilizadores (não bots) podem usar. Falhas são ignoradas.
+        max_id: opcional; por omissão usa a última mensagem recebida deste user (guardada
+            em handle_incoming) e só pede o histórico ao Telegram se não a conhecer.
         """
         if not self.client or not self.client.is_connected():
             return
         try:
-            # Obter a última mensagem no chat para usar como max_id
-            last = await self.client.get_messages(entity, limit=1)
-            max_id = last[0].id if last else 0
+            user_id = getattr(entity, "user_id", None) or getattr(entity, "id", None)
+            state = self._read_state.get(user_id) if user_id is not None else None
+            if max_id is None and state is not None:
+                if state[1]:
+                    # Já marcada como lida e sem mensagens novas desde então
+                    return
+                max_id = state[0]
+            if max_id is None:
+                # Obter a última mensagem no chat para usar como max_id
+                last = await self.client.get_messages(entity, limit=1)
+                max_id = last[0].id if last else 0
             if max_id <= 0:
                 return
             await self.client(
@@ -470,6 +802,8 @@ class TelegramAdapter(MessengerAdapter):
                     max_id=max_id,
                 )
             )
+            if state is not None and state[0] <= max_id:
+                state[1] = True
             logger.debug("[telegram] marked as read (max_id=%s)", max_id)
         except Exception as e:
             logger.debug("[telegram] mark as read failed: %s", e)
@@ -513,22 +847,9 @@ class TelegramAdapter(MessengerAdapter):
                         len(content.text),
                         recipient_id,
                     )
-                    # Telegram cancela o typing após ~5s se não for reenviado.
-                    # Reenviar a cada 4s para manter o indicador visível durante todo o tempo.
-                    try:
-                        elapsed = 0.0
-                        while elapsed < total_seconds:
-                            await self.client(
-                                functions.messages.SetTypingRequest(
-                                    peer=entity,
-                                    action=types.SendMessageTypingAction(),
-                                )
-                            )
-                            chunk = min(4.0, total_seconds - elapsed)
-                            await asyncio.sleep(chunk)
-                            elapsed += chunk
-                    except Exception as typing_err:
-                        logger.warning("[telegram] typing failed (continuing): %s", typing_err)
+                    await self._simulate_typing(
+                        entity, types.SendMessageTypingAction(), total_seconds
+                    )
 
             await self.client.send_message(entity, content.text)
             # Só marcar como "enviado pelo gateway" quando for webhook Chatwoot (não /dispatch)
@@ -556,6 +877,8 @@ class TelegramAdapter(MessengerAdapter):
                 "Telegram PeerFlood: demasiadas primeiras mensagens; aguardar antes de reenviar"
             ) from None
         except Exception as e:
+            if isinstance(e, errors.rpcerrorlist.PeerIdInvalidError):
+                self._forget_entity(recipient_id)
             logger.exception("[telegram] Failed to send text: %s", e)
             raise
 
@@ -582,26 +905,35 @@ class TelegramAdapter(MessengerAdapter):
 
         # URL relativa (ex.: Chatwoot /rails/...) precisa de base; por agora assumir absoluta
         path: Optional[str] = None
+        # Ficheiro temporário nosso (apagar no fim) vs. anexo local do Chatwoot (não tocar)
+        downloaded = False
         try:
             entity = await self._resolve_entity(recipient_id)
 
             # Marcar como lido antes do gravando áudio (o destinatário vê o "lido")
             await self._mark_as_read(entity)
 
-            # Descarregar o ficheiro primeiro (precisamos dele para obter duração do áudio)
-            async with httpx.AsyncClient(timeout=30.0, follow_redirects=True) as client:
-                r = await client.get(url)
-                r.raise_for_status()
-                ext = ".ogg" if content.media_type == "audio" else ".m4a"
-                fd, path = tempfile.mkstemp(suffix=ext)
-                os.close(fd)
-                with open(path, "wb") as f:
-                    f.write(r.content)
+            path = await asyncio.to_thread(self._local_attachment_path, url)
+            if path is None:
+                # Descarregar o ficheiro primeiro (precisamos dele para obter duração do áudio)
+                async with self._get_http().stream("GET", url) as r:
+                    r.raise_for_status()
+                    ext = ".ogg" if content.media_type == "audio" else ".m4a"
+                    path = _tmp_path(ext)
+                    downloaded = True
+                    # Escrita bloco a bloco fora do event loop (o volume pode ser lento)
+                    f = await asyncio.to_thread(open, path, "xb")
+                    try:
+                        async for chunk in r.aiter_bytes(MEDIA_DOWNLOAD_CHUNK_SIZE):
+                            await asyncio.to_thread(f.write, chunk)
+                    finally:
+                        await asyncio.to_thread(f.close)
 
             # Simular "gravando áudio": 1) duração real 2) fallback transcrição 3) fixo
             if simulate_typing:
                 if content.media_type == "audio":
-                    duration = get_audio_duration_seconds(path)
+                    # Leitura/parse dos metadados fora do event loop
+                    duration = await asyncio.to_thread(get_audio_duration_seconds, path)
                     if duration is not None:
                         total_seconds = record_audio_delay_from_duration(duration)
                         logger.info(
@@ -619,38 +951,25 @@ class TelegramAdapter(MessengerAdapter):
                             recipient_id,
                         )
                     else:
-                        total_seconds = 1.0 + random.random()
+                        total_seconds = 1.5 + _jitter(0.5)  # 1-2s
                         logger.info(
                             "[telegram] typing (record_audio) for %.2fs — usado: fallback fixo (duração e transcrição indisponíveis) — before sending to %s",
                             total_seconds,
                             recipient_id,
                         )
                 else:
-                    total_seconds = 1.0 + random.random()
+                    total_seconds = 1.5 + _jitter(0.5)  # 1-2s
                     logger.info(
                         "[telegram] typing for %.2fs before sending media to %s",
                         total_seconds,
                         recipient_id,
                     )
-                try:
-                    action = (
-                        types.SendMessageRecordAudioAction()
-                        if content.media_type == "audio"
-                        else types.SendMessageTypingAction()
-                    )
-                    elapsed = 0.0
-                    while elapsed < total_seconds:
-                        await self.client(
-                            functions.messages.SetTypingRequest(
-                                peer=entity,
-                                action=action,
-                            )
-                        )
-                        chunk = min(4.0, total_seconds - elapsed)
-                        await asyncio.sleep(chunk)
-                        elapsed += chunk
-                except Exception as typing_err:
-                    logger.warning("[telegram] typing failed (continuing): %s", typing_err)
+                action = (
+                    types.SendMessageRecordAudioAction()
+                    if content.media_type == "audio"
+                    else types.SendMessageTypingAction()
+                )
+                await self._simulate_typing(entity, action, total_seconds)
 
             # Enviar como voice para áudio (nota de voz no Telegram)
             is_voice = content.media_type == "audio"
@@ -662,10 +981,36 @@ class TelegramAdapter(MessengerAdapter):
                 is_voice,
             )
         except Exception as e:
+            if isinstance(e, errors.rpcerrorlist.PeerIdInvalidError):
+                self._forget_entity(recipient_id)
             logger.exception("[telegram] Failed to send_media: %s", e)
         finally:
-            if path and os.path.isfile(path):
+            # unlink fora do event loop (o ficheiro pode estar num volume lento)
+            if downloaded and path:
                 try:
-                    os.unlink(path)
+                    await asyncio.to_thread(os.unlink, path)
                 except OSError:
                     pass
+
+    def _local_attachment_path(self, url: str) -> Optional[str]:
+        """
+        URL com o prefixo CHATWOOT_ATTACH_LOCAL_PREFIX (o resto do caminho é relativo a
+        CHATWOOT_ATTACH_LOCAL_DIR) ou file:// de um ficheiro dentro desse diretório -> caminho
+        local. Qualquer outra URL (ou fora do diretório) -> None (segue por HTTP).
+        Faz I/O de disco (realpath/isfile): chamar via asyncio.to_thread.
+        """
+        root = self._local_attach_root
+        if not root:
+            return None
+        prefix = self._local_attach_prefix
+        if prefix and url.startswith(prefix):
+            rel = urllib.parse.unquote(urllib.parse.urlsplit(url[len(prefix):]).path)
+            local = os.path.realpath(os.path.join(root, rel.lstrip("/")))
+        elif url.startswith("file://"):
+            local = os.path.realpath(urllib.parse.unquote(urllib.parse.urlsplit(url).path))
+        else:
+            return None
+        if os.path.commonpath([root, local]) != root or not os.path.isfile(local):
+            logger.warning("[telegram] send_media: ficheiro local fora de %s: %s", root, url)
+            return None
+        return local
@@ -1,21 +1,34 @@
 import logging
 import secrets
-from typing import Any, Awaitable, Callable, Dict, Optional
+from typing import Any, Awaitable, Callable, Dict, List, Optional
 
 import httpx  # NEW
-from pyee.asyncio import AsyncIOEventEmitter
 
 from app.config import VKCommunityConfig
 from app.domain.message import TextContent, UnifiedMessage
 from app.domain.ports import MessengerAdapter, OnMessage
+from app.infra.bus import EventBus
 
 logger = logging.getLogger(__name__)
 
+# messages.send aceita no máximo 100 destinatários em peer_ids
+VK_MAX_PEER_IDS = 100
+
 
 class VkAdapter(MessengerAdapter):
     """VK adapter for Callback API (text only)."""
 
-    def __init__(self, bus: AsyncIOEventEmitter, config: VKCommunityConfig):
+    __slots__ = (
+        "_bus",
+        "_config",
+        "inbox_id",
+        "_cb",
+        "_incoming_listener",
+        "_confirm_listener",
+        "_http",
+    )
+
+    def __init__(self, bus: EventBus, config: VKCommunityConfig):
         self._bus = bus
         self._config = config
         self.inbox_id = config.inbox_id
@@ -150,3 +163,51 @@ class VkAdapter(MessengerAdapter):
             logger.info("[vk] SENT: peer_id=%s message_id=%s", recipient_id, res)
         except Exception as e:
             logger.exception("[vk] Failed to send text to %s: %s", recipient_id, e)
+
+    async def send_text_many(
+        self, recipient_ids: List[str], content: TextContent
+    ) -> Dict[str, str]:
+        """
+        Send the same text to up to 100 peers per messages.send (peer_ids).
+        Returns the peers that failed (recipient_id -> error); empty when all were sent.
+        """
+        text = content.text or ""
+        if not text or not recipient_ids:
+            logger.info("[vk] skip send: empty text or no recipients")
+            return {}
+
+        failed: Dict[str, str] = {}
+        for start in range(0, len(recipient_ids), VK_MAX_PEER_IDS):
+            chunk = recipient_ids[start : start + VK_MAX_PEER_IDS]
+            try:
+                # peer_id devolvido pelo VK (int) -> recipient_id original
+                by_peer = {int(rid): rid for rid in chunk}
+                params = {
+                    "peer_ids": ",".join(str(peer) for peer in by_peer),
+                    "message": text,
+                    "random_id": secrets.randbits(31),
+                    "group_id": self._config.group_id,
+                }
+                res = await self._vk_call("messages.send", params)
+            except Exception as e:
+                logger.exception(
+                    "[vk] Failed to send text to %s: %s", ",".join(chunk), e
+                )
+                failed.update((rid, str(e)) for rid in chunk)
+                continue
+            # With peer_ids VK returns one item per peer: {peer_id, message_id} or {error}
+            for item in res if isinstance(res, list) else []:
+                peer_id = item.get("peer_id")
+                if item.get("error"):
+                    logger.error(
+                        "[vk] Failed to send text to %s: %s", peer_id, item.get("error")
+                    )
+                    rid = by_peer.get(peer_id, str(peer_id))
+                    failed[rid] = f"VK error for peer {peer_id}: {item.get('error')}"
+                else:
+                    logger.info(
+                        "[vk] SENT: peer_id=%s message_id=%s",
+                        peer_id,
+                        item.get("message_id"),
+                    )
+        return failed
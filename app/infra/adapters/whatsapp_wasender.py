@@ -1,12 +1,11 @@
 import logging
 from typing import Optional
 
-from pyee.asyncio import AsyncIOEventEmitter
-
 from app.config import WasenderWebhookConfig
 from app.domain.message import TextContent, UnifiedMessage
 from app.domain.ports import MessengerAdapter, OnMessage
 from app.domain.webhooks.wasender import WasenderWebhookPayload
+from app.infra.bus import EventBus
 from app.infra.wasender_client import WasenderClient
 
 logger = logging.getLogger(__name__)
@@ -15,7 +14,9 @@ logger = logging.getLogger(__name__)
 class WasenderAdapter(MessengerAdapter):
     """WhatsApp adapter (text only) via Wasender."""
 
-    def __init__(self, bus: AsyncIOEventEmitter, config: WasenderWebhookConfig):
+    __slots__ = ("_bus", "_config", "inbox_id", "_cb", "_client")
+
+    def __init__(self, bus: EventBus, config: WasenderWebhookConfig):
         self._bus = bus
         self._config = config
         self.inbox_id = config.inbox_id  # expose per-channel inbox
@@ -26,7 +27,7 @@ class WasenderAdapter(MessengerAdapter):
         self._cb = cb
 
     async def start(self) -> None:
-        @self.bus.on("wasender.incoming")
+        @self._bus.on("wasender.incoming")
         async def _incoming(payload: dict):
             if not self._cb:
                 logger.warning("[wasender] No on_message callback set; dropping event")
@@ -61,7 +62,7 @@ class WasenderAdapter(MessengerAdapter):
                 )
                 return
 
-            recipient_id = (info.get("remoteJid") or "").split("@")[0]
+            recipient_id = (info.get("remoteJid") or "").partition("@")[0]
             msg = UnifiedMessage(
                 channel="whatsapp",
                 recipient_id=recipient_id,
@@ -75,7 +76,15 @@ class WasenderAdapter(MessengerAdapter):
             except Exception as e:
                 logger.exception("[wasender] on_message callback failed: %s", e)
 
-        @self.bus.on("wasender.outgoing")
+        @self._bus.on("wasender.incoming.batch")
+        async def _incoming_batch(payload: dict):
+            # Upsert com várias mensagens: tratar cada uma como um wasender.incoming
+            data = payload.get("data") or {}
+            for raw in data.get("messages") or ():
+                if isinstance(raw, dict):
+                    await _incoming({**payload, "data": {**data, "messages": raw}})
+
+        @self._bus.on("wasender.outgoing")
         async def _outgoing(payload: dict):
             logger.debug("[wasender] Outgoing event received (noop)")
 
@@ -0,0 +1,67 @@
+import asyncio
+import functools
+import logging
+from typing import Any, Callable, Dict, Optional, Set, Tuple
+
+logger = logging.getLogger(__name__)
+
+Handler = Callable[..., Any]
+
+
+class EventBus:
+    """
+    In-process event bus with the part of pyee's AsyncIOEventEmitter API used by the
+    gateway (on / emit / remove_listener), without its per-emit lock and listener copies.
+    Sync handlers run inline; coroutine handlers are scheduled as tasks on the running
+    loop (fire-and-forget, emit does not wait). Handler errors are logged, not raised.
+    """
+
+    def __init__(self) -> None:
+        # Tuplas substituídas a cada on/remove: emit itera sem copiar a lista
+        self._handlers: Dict[str, Tuple[Handler, ...]] = {}
+        # Referências fortes às tasks em curso (o loop só guarda referências fracas)
+        self._tasks: Set["asyncio.Task[Any]"] = set()
+
+    def on(self, event: str, f: Optional[Handler] = None) -> Any:
+        """Register f for event; without f, return a decorator (like pyee)."""
+        if f is None:
+            return functools.partial(self.on, event)
+        self._handlers[event] = self._handlers.get(event, ()) + (f,)
+        return f
+
+    def remove_listener(self, event: str, f: Handler) -> None:
+        """Unregister f (first registration); KeyError if it is not registered."""
+        handlers = self._handlers.get(event, ())
+        if f not in handlers:
+            raise KeyError(event)
+        i = handlers.index(f)
+        rest = handlers[:i] + handlers[i + 1 :]
+        if rest:
+            self._handlers[event] = rest
+        else:
+            del self._handlers[event]
+
+    def emit(self, event: str, *args: Any, **kwargs: Any) -> bool:
+        """Call the handlers of event; True if there was at least one."""
+        handlers = self._handlers.get(event)
+        if not handlers:
+            return False
+        for f in handlers:
+            try:
+                result = f(*args, **kwargs)
+            except Exception:
+                logger.exception("[bus] handler for %r failed", event)
+                continue
+            if asyncio.iscoroutine(result):
+                task = asyncio.get_running_loop().create_task(result)
+                self._tasks.add(task)
+                task.add_done_callback(functools.partial(self._task_done, event))
+        return True
+
+    def _task_done(self, event: str, task: "asyncio.Task[Any]") -> None:
+        self._tasks.discard(task)
+        if task.cancelled():
+            return
+        exc = task.exception()
+        if exc is not None:
+            logger.error("[bus] handler for %r failed", event, exc_info=exc)
@@ -1,22 +1,57 @@
+import asyncio
+import importlib.util
+import logging
 import os
-from typing import Any, Dict, List, Optional
+import secrets
+from typing import Any, AsyncIterator, Dict, List, Optional, Tuple
 
 import httpx
+import orjson
+
+logger = logging.getLogger(__name__)
+
+# HTTP/2 requer o pacote h2 (extra httpx[http2]); sem ele o httpx recusa http2=True
+HTTP2_AVAILABLE = importlib.util.find_spec("h2") is not None
+
+JSON_HEADERS = {"Content-Type": "application/json"}
+
+# Tamanho dos blocos lidos do disco ao enviar anexos (upload em streaming)
+UPLOAD_CHUNK_SIZE = 64 * 1024
+
+DEFAULT_LIMITS = httpx.Limits(
+    max_keepalive_connections=20,
+    max_connections=100,
+    keepalive_expiry=30.0,
+)
 
 
 class ChatwootClient:
     """
     Lightweight HTTP client for Chatwoot API v1.
     Only methods needed by our service are implemented.
+    A single httpx.AsyncClient is kept per instance (keep-alive, HTTP/2 when h2 is
+    installed) so sequential and concurrent requests share connections; call aclose() on shutdown.
     """
 
-    def __init__(self, api_access_token: str, account_id: int, base_url: str):
+    def __init__(
+        self,
+        api_access_token: str,
+        account_id: int,
+        base_url: str,
+        *,
+        http2: bool = True,
+        limits: Optional[httpx.Limits] = None,
+    ):
         # Normalize base_url and store common parts
         self._base_url = base_url.rstrip("/")
         self._account_id = account_id
 
-        # Precomputed base for account-scoped endpoints
+        # Precomputed base for account-scoped endpoints (and the fixed URLs built from it)
         self._account_base = f"{self._base_url}/api/v1/accounts/{self._account_id}"
+        self._contacts_url = f"{self._account_base}/contacts"
+        self._contacts_search_url = f"{self._contacts_url}/search"
+        self._contacts_filter_url = f"{self._contacts_url}/filter"
+        self._conversations_url = f"{self._account_base}/conversations"
 
         # Static headers with API token (add both headers for compatibility)
         self._headers = {
@@ -25,22 +60,79 @@ class ChatwootClient:
             "Authorization": f"Bearer {api_access_token}",
         }
 
+        self._http2 = http2 and HTTP2_AVAILABLE
+        self._limits = limits or DEFAULT_LIMITS
+        self._http: Optional[httpx.AsyncClient] = None
+        self._http_version_logged = False
+
+    def _get_http(self) -> httpx.AsyncClient:
+        """Return the shared client, creating it on first use (inside the running loop)."""
+        if self._http is None:
+            # Content-Type não vai nos headers fixos: json= define application/json e o
+            # multipart dos anexos precisa do boundary gerado pelo httpx
+            headers = {
+                k: v for k, v in self._headers.items() if k.lower() != "content-type"
+            }
+            self._http = httpx.AsyncClient(
+                headers=headers,
+                timeout=15.0,
+                limits=self._limits,
+                http2=self._http2,
+            )
+        return self._http
+
+    async def aclose(self) -> None:
+        """Close the shared HTTP client (pooled connections)."""
+        if self._http is not None:
+            await self._http.aclose()
+            self._http = None
+
+    async def __aenter__(self) -> "ChatwootClient":
+        return self
+
+    async def __aexit__(self, *exc_info: Any) -> None:
+        await self.aclose()
+
+    async def prewarm(self, connections: int = 4) -> None:
+        """Open pooled connections (TCP+TLS) ahead of the first webhook burst; errors are ignored."""
+        client = self._get_http()
+        results = await asyncio.gather(
+            *(client.head(f"{self._account_base}/") for _ in range(connections)),
+            return_exceptions=True,
+        )
+        failed = [r for r in results if isinstance(r, BaseException)]
+        if failed:
+            logger.debug(
+                "[chatwoot] prewarm: %s/%s failed: %s",
+                len(failed),
+                connections,
+                failed[0],
+            )
+
+    async def _request(self, method: str, url: str, **kwargs: Any) -> Dict[str, Any]:
+        # JSON (de)serializado com orjson em vez do json da stdlib usado pelo httpx
+        if "json" in kwargs:
+            kwargs["content"] = orjson.dumps(kwargs.pop("json"))
+            extra = kwargs.get("headers")
+            kwargs["headers"] = {**extra, **JSON_HEADERS} if extra else JSON_HEADERS
+        r = await self._get_http().request(method, url, **kwargs)
+        if not self._http_version_logged:
+            self._http_version_logged = True
+            logger.info("[chatwoot] API connection uses %s", r.http_version)
+        r.raise_for_status()
+        return orjson.loads(r.content)
+
     # Contacts
     async def search_contacts(self, q: str) -> Dict[str, Any]:
         """Search contacts by name/identifier/email/phone."""
-        url = f"{self._account_base}/contacts/search"
         params = {"q": q}
-        async with httpx.AsyncClient(headers=self._headers, timeout=15.0) as client:
-            r = await client.get(url, params=params)
-            r.raise_for_status()
-            return r.json()
+        return await self._request("GET", self._contacts_search_url, params=params)
 
     async def filter_contacts(self, attrs: Dict[str, Any]) -> Dict[str, Any]:
         """
         Filter contacts by attributes supported by /contacts/filter.
         attribute_key MUST be the raw key (e.g., "vk_user_id"), not "custom_attribute_*".
         """
-        url = f"{self._account_base}/contacts/filter"
         filters: List[Dict[str, Any]] = []
         for key, value in attrs.items():
             filters.append(
@@ -52,10 +144,7 @@ class ChatwootClient:
             )
         payload = {"payload": filters}
 
-        async with httpx.AsyncClient(headers=self._headers, timeout=15.0) as client:
-            r = await client.post(url, json=payload)
-            r.raise_for_status()
-            return r.json()
+        return await self._request("POST", self._contacts_filter_url, json=payload)
 
     async def create_contact(
         self,
@@ -69,15 +158,12 @@ class ChatwootClient:
         additional_attributes: Optional[Dict[str, Any]] = None,  # NEW
     ) -> Dict[str, Any]:
         """Create a contact in a specific inbox (inbox_id is required by API)."""
-        url = f"{self._account_base}/contacts"
         payload: Dict[str, Any] = {"inbox_id": inbox_id}
 
         if name:
             payload["name"] = name
         if phone_number:
-            payload["phone_number"] = (
-                phone_number if phone_number.startswith("+") else f"+{phone_number}"
-            )
+            payload["phone_number"] = _e164(phone_number)
         if email:
             payload["email"] = email
         if identifier:
@@ -87,10 +173,7 @@ class ChatwootClient:
         if additional_attributes:
             payload["additional_attributes"] = additional_attributes
 
-        async with httpx.AsyncClient(headers=self._headers, timeout=15.0) as client:
-            r = await client.post(url, json=payload)
-            r.raise_for_status()
-            return r.json()
+        return await self._request("POST", self._contacts_url, json=payload)
 
     async def update_contact(
         self,
@@ -104,14 +187,12 @@ class ChatwootClient:
         additional_attributes: Optional[Dict[str, Any]] = None,  # NEW
     ) -> Dict[str, Any]:
         """Patch contact fields, custom attributes, and additional attributes."""
-        url = f"{self._account_base}/contacts/{contact_id}"
+        url = f"{self._contacts_url}/{contact_id}"
         payload: Dict[str, Any] = {}
         if name is not None:
             payload["name"] = name
         if phone_number is not None:
-            payload["phone_number"] = (
-                phone_number if phone_number.startswith("+") else f"+{phone_number}"
-            )
+            payload["phone_number"] = _e164(phone_number)
         if email is not None:
             payload["email"] = email
         if identifier:
@@ -121,19 +202,31 @@ class ChatwootClient:
         if additional_attributes is not None:
             payload["additional_attributes"] = additional_attributes
 
-        async with httpx.AsyncClient(headers=self._headers, timeout=15.0) as client:
-            r = await client.patch(url, json=payload)
-            r.raise_for_status()
-            return r.json()
+        return await self._request("PATCH", url, json=payload)
 
     # Conversations
-    async def list_conversations(self, contact_id: int) -> Dict[str, Any]:
-        """List conversations for a contact."""
-        url = f"{self._account_base}/contacts/{contact_id}/conversations"
-        async with httpx.AsyncClient(headers=self._headers, timeout=15.0) as client:
-            r = await client.get(url)
-            r.raise_for_status()
-            return r.json()
+    async def list_conversations(
+        self,
+        contact_id: int,
+        *,
+        status: Optional[str] = None,
+        source_id: Optional[str] = None,
+        inbox_id: Optional[int] = None,
+    ) -> Dict[str, Any]:
+        """
+        List conversations for a contact.
+        status/source_id/inbox_id are sent as query params so servers that support them
+        can filter; older Chatwoot versions ignore them and return everything.
+        """
+        url = f"{self._contacts_url}/{contact_id}/conversations"
+        params: Dict[str, Any] = {}
+        if status:
+            params["status"] = status
+        if source_id:
+            params["source_id"] = source_id
+        if inbox_id:
+            params["inbox_id"] = inbox_id
+        return await self._request("GET", url, params=params or None)
 
     async def create_conversation(
         self,
@@ -144,17 +237,13 @@ class ChatwootClient:
         **extra_fields: Any,
     ) -> Dict[str, Any]:
         """Create a conversation bound to source_id in the given inbox (API requires inbox_id)."""
-        url = f"{self._account_base}/conversations"
         payload: Dict[str, Any] = {"source_id": source_id, "inbox_id": inbox_id}
         if contact_id:
             payload["contact_id"] = contact_id
         if extra_fields:
             payload.update(extra_fields)
 
-        async with httpx.AsyncClient(headers=self._headers, timeout=15.0) as client:
-            r = await client.post(url, json=payload)
-            r.raise_for_status()
-            return r.json()
+        return await self._request("POST", self._conversations_url, json=payload)
 
     # Messages
     async def send_message(
@@ -165,7 +254,7 @@ class ChatwootClient:
         **extra_fields: Any,
     ) -> Dict[str, Any]:
         """Send a message to a conversation. Chatwoot API expects content and message_type."""
-        url = f"{self._account_base}/conversations/{conversation_id}/messages"
+        url = f"{self._conversations_url}/{conversation_id}/messages"
         payload: Dict[str, Any] = {
             "content": content,
             "message_type": message_type,
@@ -173,10 +262,7 @@ class ChatwootClient:
         if extra_fields:
             payload.update(extra_fields)
 
-        async with httpx.AsyncClient(headers=self._headers, timeout=15.0) as client:
-            r = await client.post(url, json=payload)
-            r.raise_for_status()
-            return r.json()
+        return await self._request("POST", url, json=payload)
 
     async def send_message_with_attachment(
         self,
@@ -186,17 +272,81 @@ class ChatwootClient:
         message_type: str = "incoming",
         content_type: Optional[str] = None,
     ) -> Dict[str, Any]:
-        """Send a message with file attachment (multipart/form-data). Used for áudio/voice."""
-        url = f"{self._account_base}/conversations/{conversation_id}/messages"
-        headers = {
-            k: v for k, v in self._headers.items() if k.lower() != "content-type"
-        }
+        """
+        Send a message with file attachment (multipart/form-data). Used for áudio/voice.
+        The file is streamed from disk in chunks (read off the event loop), never loaded whole.
+        """
+        url = f"{self._conversations_url}/{conversation_id}/messages"
         content_type = content_type or "application/octet-stream"
         filename = os.path.basename(file_path)
-        with open(file_path, "rb") as f:
-            files = {"attachments[]": (filename, f, content_type)}
-            data = {"content": content or "", "message_type": message_type}
-            async with httpx.AsyncClient(headers=headers, timeout=30.0) as client:
-                r = await client.post(url, data=data, files=files)
-                r.raise_for_status()
-                return r.json()
+        boundary = secrets.token_hex(16)
+        head, tail = _multipart_envelope(
+            boundary,
+            {"content": content or "", "message_type": message_type},
+            field="attachments[]",
+            filename=filename,
+            content_type=content_type,
+        )
+        size = await asyncio.to_thread(os.path.getsize, file_path)
+        headers = {
+            "Content-Type": f"multipart/form-data; boundary={boundary}",
+            "Content-Length": str(len(head) + size + len(tail)),
+        }
+        return await self._request(
+            "POST",
+            url,
+            content=_stream_file(file_path, head, tail),
+            headers=headers,
+            timeout=30.0,
+        )
+
+
+def _e164(phone_number: str) -> str:
+    """Phone number with the leading '+' Chatwoot expects."""
+    return phone_number if phone_number[:1] == "+" else "+" + phone_number
+
+
+def _multipart_envelope(
+    boundary: str,
+    fields: Dict[str, str],
+    *,
+    field: str,
+    filename: str,
+    content_type: str,
+) -> Tuple[bytes, bytes]:
+    """Bytes before and after the file content in a multipart/form-data body."""
+    parts: List[bytes] = []
+    for name, value in fields.items():
+        parts.append(
+            f'--{boundary}\r\nContent-Disposition: form-data; name="{name}"\r\n\r\n'.encode()
+            + value.encode()
+            + b"\r\n"
+        )
+    safe_name = (
+        filename.replace("\\", "\\\\")
+        .replace('"', "%22")
+        .replace("\r", "")
+        .replace("\n", "")
+    )
+    parts.append(
+        (
+            f"--{boundary}\r\n"
+            f'Content-Disposition: form-data; name="{field}"; filename="{safe_name}"\r\n'
+            f"Content-Type: {content_type}\r\n\r\n"
+        ).encode()
+    )
+    return b"".join(parts), f"\r\n--{boundary}--\r\n".encode()
+
+
+async def _stream_file(path: str, head: bytes, tail: bytes) -> AsyncIterator[bytes]:
+    yield head
+    f = await asyncio.to_thread(open, path, "rb")
+    try:
+        while True:
+            chunk = await asyncio.to_thread(f.read, UPLOAD_CHUNK_SIZE)
+            if not chunk:
+                break
+            yield chunk
+    finally:
+        await asyncio.to_thread(f.close)
+    yield tail
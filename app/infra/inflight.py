@@ -0,0 +1,41 @@
+import asyncio
+from typing import Awaitable, Callable, Dict, Generic, Hashable, TypeVar
+
+T = TypeVar("T")
+
+
+class Inflight(Generic[T]):
+    """
+    One in-flight call per key: concurrent callers with the same key await the result
+    (or the error) of the call already running instead of repeating it. Only a real
+    cancellation of the running call cancels the shared result.
+    """
+
+    def __init__(self) -> None:
+        self._futures: Dict[Hashable, "asyncio.Future[T]"] = {}
+
+    def __contains__(self, key: Hashable) -> bool:
+        return key in self._futures
+
+    async def run(self, key: Hashable, factory: Callable[[], Awaitable[T]]) -> T:
+        pending = self._futures.get(key)
+        if pending is not None:
+            return await asyncio.shield(pending)
+
+        fut: "asyncio.Future[T]" = asyncio.get_running_loop().create_future()
+        self._futures[key] = fut
+        try:
+            result = await factory()
+        except asyncio.CancelledError:
+            fut.cancel()
+            raise
+        except BaseException as e:
+            fut.set_exception(e)
+            fut.exception()  # marcar como lida (pode não haver outros à espera)
+            raise
+        else:
+            fut.set_result(result)
+            return result
+        finally:
+            if self._futures.get(key) is fut:
+                del self._futures[key]
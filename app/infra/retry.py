@@ -0,0 +1,89 @@
+import asyncio
+import functools
+import logging
+import random
+import re
+from typing import Any, Awaitable, Callable, TypeVar
+
+import httpx
+
+logger = logging.getLogger(__name__)
+
+T = TypeVar("T")
+
+# Respostas que indicam limite de taxa/sobrecarga temporária do upstream: o pedido não foi
+# processado, seguro repetir mesmo um POST
+RETRY_STATUS_CODES = {429, 503}
+# Erros do proxy à frente do upstream: o pedido pode já ter sido processado, por isso só
+# se repetem chamadas idempotentes (GET/PATCH, ou POST só de leitura como /contacts/filter)
+IDEMPOTENT_RETRY_STATUS_CODES = {502, 504}
+# Falhas de ligação em que o pedido não chegou a ser enviado: seguro repetir mesmo um POST
+RETRY_TRANSPORT_ERRORS = (httpx.ConnectError, httpx.ConnectTimeout, httpx.PoolTimeout)
+_RATE_LIMIT_RE = re.compile(r"rate.?limit|quota", re.IGNORECASE)
+
+
+def is_rate_limited(exc: BaseException, idempotent: bool = False) -> bool:
+    """
+    True if exc is an HTTP error worth retrying: 429/503 or a rate limit/quota body,
+    plus 502/504 when the call is idempotent.
+    """
+    if not isinstance(exc, httpx.HTTPStatusError):
+        return False
+    status = exc.response.status_code
+    if status in RETRY_STATUS_CODES or (
+        idempotent and status in IDEMPOTENT_RETRY_STATUS_CODES
+    ):
+        return True
+    try:
+        body = exc.response.text
+    except Exception:
+        return False
+    return bool(_RATE_LIMIT_RE.search(body or ""))
+
+
+def is_transient(exc: BaseException, idempotent: bool = False) -> bool:
+    """True if exc is worth retrying: rate limiting/overload or a request that was never sent."""
+    return isinstance(exc, RETRY_TRANSPORT_ERRORS) or is_rate_limited(exc, idempotent)
+
+
+def retry_on_429(
+    max_attempts: int = 3, base: float = 0.5, cap: float = 8.0, idempotent: bool = False
+) -> Callable[[Callable[..., Awaitable[T]]], Callable[..., Awaitable[T]]]:
+    """
+    Retry an async call on rate limiting/overload (429, 503) and connection failures
+    with exponential backoff + jitter: sleeps min(cap, base * 2**n) + random(0, base).
+    idempotent=True also retries proxy errors (502, 504), which a POST that creates
+    something must not repeat. Any other error (or the last attempt) is re-raised unchanged.
+    """
+
+    def decorator(fn: Callable[..., Awaitable[T]]) -> Callable[..., Awaitable[T]]:
+        @functools.wraps(fn)
+        async def wrapper(*args: Any, **kwargs: Any) -> T:
+            attempt = 0
+            while True:
+                try:
+                    return await fn(*args, **kwargs)
+                except httpx.HTTPError as e:
+                    attempt += 1
+                    if attempt >= max_attempts or not is_transient(e, idempotent):
+                        raise
+                    delay = min(cap, base * 2 ** (attempt - 1)) + random.uniform(
+                        0, base
+                    )
+                    logger.warning(
+                        "[retry] %s got %s, retry %s/%s in %.2fs",
+                        getattr(fn, "__name__", fn),
+                        (
+                            f"HTTP {e.response.status_code}"
+                            if isinstance(e, httpx.HTTPStatusError)
+                            else type(e).__name__
+                        ),
+                        attempt,
+                        max_attempts - 1,
+                        delay,
+                    )
+                    await asyncio.sleep(delay)
+
+        return wrapper
+
+    return decorator
@@ -1,20 +1,27 @@
 import asyncio
 import logging
+from concurrent.futures import ThreadPoolExecutor
 from contextlib import asynccontextmanager
-from typing import Any, Dict
+from types import MappingProxyType
+from typing import Any, Dict, Mapping
 
 import uvicorn
 from dotenv import load_dotenv
 from fastapi import FastAPI
-from pyee.asyncio import AsyncIOEventEmitter
+from fastapi.responses import ORJSONResponse
 
-from app.application.events import wire_events
+from app.application.events import close_events, wire_events
 from app.application.router import MessageRouter
 from app.config import load_config
-from app.delivery.http import create_router
+from app.delivery.http import close_http, create_router
 from app.infra.adapters.telegram_telethon import TelegramAdapter
 from app.infra.adapters.vk_bot import VkAdapter
 from app.infra.adapters.whatsapp_wasender import WasenderAdapter
+from app.infra.bus import EventBus
+
+# Tempo máximo do stop() de cada adapter no shutdown (ex.: disconnect do Telethon preso):
+# o resto do shutdown (clientes HTTP, filas) corre antes do SIGKILL do orquestrador (~10s)
+ADAPTER_STOP_TIMEOUT_SEC = 5.0
 
 logging.basicConfig(
     level=logging.INFO, format="%(asctime)s %(levelname)s [%(name)s] %(message)s"
@@ -25,50 +32,90 @@ load_dotenv()
 config = load_config()
 
 # Shared event bus
-bus = AsyncIOEventEmitter()
+bus = EventBus()
 
 # Build adapters registry only for configured channels
-adapters: Dict[str, Any] = {}
+_adapters: Dict[str, Any] = {}
 
 if config.wasender:
-    adapters["whatsapp"] = WasenderAdapter(bus=bus, config=config.wasender)
+    _adapters["whatsapp"] = WasenderAdapter(bus=bus, config=config.wasender)
 
 if config.telegram:
-    adapters["telegram"] = TelegramAdapter(bus=bus, config=config.telegram)
+    _adapters["telegram"] = TelegramAdapter(bus=bus, config=config.telegram)
 
 if config.vk:
-    adapters["vk"] = VkAdapter(bus=bus, config=config.vk)
+    _adapters["vk"] = VkAdapter(bus=bus, config=config.vk)
+
+# Registo fixo a partir daqui: vista só de leitura + nomes/pares calculados uma vez
+adapters: Mapping[str, Any] = MappingProxyType(_adapters)
+ADAPTER_NAMES = tuple(adapters)
+ADAPTER_ITEMS = tuple(adapters.items())
 
 router = MessageRouter(
     adapters=adapters,
     chatwoot_base_url=str(config.chatwoot.base_url),
     bus=bus,
+    concurrency=config.router_concurrency,
 )
 
-# Wire adapter incoming → application router (existing behavior)
+# Wire adapter incoming → application router (existing behavior); o mesmo bound method
+# para todos os adapters, que o guardam em _cb e o chamam diretamente por mensagem
+on_incoming = router.handle_incoming
 for a in adapters.values():
-    a.on_message(router.handle_incoming)
+    a.on_message(on_incoming)
 
 # Wire bus event handlers (moved out of main into application layer)
 wire_events(bus=bus, config=config, adapters=adapters, router=router)
 
 
+async def _run_adapters(action: str, timeout: float | None = None) -> None:
+    """Run start()/stop() on all adapters concurrently, logging each one's duration and failure."""
+    loop = asyncio.get_running_loop()
+
+    async def run(name: str, adapter: Any) -> None:
+        t0 = loop.time()
+        try:
+            await asyncio.wait_for(getattr(adapter, action)(), timeout)
+        except Exception as e:
+            logging.error("adapter %s failed to %s: %r", name, action, e, exc_info=e)
+        finally:
+            logging.info(
+                "adapter %s %s took %.1f ms", name, action, (loop.time() - t0) * 1000
+            )
+
+    await asyncio.gather(*(run(name, a) for name, a in ADAPTER_ITEMS))
+
+
 @asynccontextmanager
 async def lifespan(app: FastAPI):
     # Log here (server process only; avoids duplicate logs from reloader)
-    logging.info("adapters configured: %s", list(adapters.keys()))
-    await asyncio.gather(
-        *(a.start() for a in adapters.values()), return_exceptions=True
+    logging.info("adapters configured: %s", list(ADAPTER_NAMES))
+    # Executor limitado para o trabalho bloqueante (asyncio.to_thread): o default do asyncio
+    # chega a 32 threads num host com muitos cores, para poucas operações de disco
+    asyncio.get_running_loop().set_default_executor(
+        ThreadPoolExecutor(
+            max_workers=config.blocking_io_workers, thread_name_prefix="bridge-io"
+        )
     )
+    # Um adapter que falha não impede os outros de arrancar, mas a falha fica registada
+    await _run_adapters("start")
+    # Pré-aquecer ligações HTTP (Chatwoot/VK) em background
+    bus.emit("app.started")
     try:
         yield
     finally:
-        await asyncio.gather(
-            *(a.stop() for a in adapters.values()), return_exceptions=True
-        )
+        await _run_adapters("stop", ADAPTER_STOP_TIMEOUT_SEC)
+        await close_http()
+        await close_events()
 
 
-app = FastAPI(title="Messaging Bridge", version="0.1.0", lifespan=lifespan)
+app = FastAPI(
+    title="Messaging Bridge",
+    version="0.1.0",
+    lifespan=lifespan,
+    # Rotas registadas diretamente na app também respondem com orjson (como o router)
+    default_response_class=ORJSONResponse,
+)
 app.include_router(create_router(bus=bus, config=config, message_router=router))
 
 if __name__ == "__main__":
@@ -10,26 +10,39 @@ Copia a saída e cola no Coolify em Variáveis → TG_SESSION_BASE64
 import base64
 import os
 import sys
+from pathlib import Path
+
+# Raiz do projeto (pasta acima de scripts/)
+ROOT = Path(__file__).resolve().parents[1]
 
 try:
     from dotenv import load_dotenv
-    root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
-    load_dotenv(os.path.join(root, ".env"))
+    load_dotenv(ROOT / ".env")
 except ImportError:
-    root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+    pass
 
 session_name = (os.getenv("TG_SESSION_NAME") or "session").strip()
-session_file = os.path.join(root, f"{session_name}.session")
+session_file = ROOT / f"{session_name}.session"
 
-if not os.path.isfile(session_file):
+if not session_file.is_file():
     print(f"Ficheiro não encontrado: {session_file}", file=sys.stderr)
     print("Corre primeiro: py -3 scripts/login_telegram.py", file=sys.stderr)
     sys.exit(1)
 
-with open(session_file, "rb") as f:
-    b64 = base64.b64encode(f.read()).decode("ascii")
+if session_file.stat().st_size == 0:
+    print(f"Ficheiro vazio: {session_file}", file=sys.stderr)
+    print("Corre primeiro: py -3 scripts/login_telegram.py", file=sys.stderr)
+    sys.exit(1)
+
+# Blocos com tamanho múltiplo de 3: o base64 de cada bloco concatena sem padding intermédio
+CHUNK_SIZE = 3 * 64 * 1024
 
 print("Copia o bloco abaixo e cola em Coolify → Variáveis → TG_SESSION_BASE64:")
 print()
-print(b64)
+sys.stdout.flush()
+with session_file.open("rb") as f:
+    while chunk := f.read(CHUNK_SIZE):
+        sys.stdout.buffer.write(base64.b64encode(chunk))
+sys.stdout.buffer.flush()
+print()
 print()
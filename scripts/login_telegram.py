@@ -10,17 +10,20 @@ Variáveis: TG_API_ID, TG_API_HASH; opcional: TG_SESSION_NAME (default: session)
 import asyncio
 import os
 import sys
+from pathlib import Path
+
+from telethon import TelegramClient
+
+# Raiz do projeto (pasta acima de scripts/)
+ROOT = Path(__file__).resolve().parents[1]
 
 # carregar .env da raiz do projeto
 try:
     from dotenv import load_dotenv
-    root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
-    load_dotenv(os.path.join(root, ".env"))
+    load_dotenv(ROOT / ".env")
 except ImportError:
     pass
 
-from telethon import TelegramClient
-
 
 def main():
     api_id = os.getenv("TG_API_ID")